@@ -18,13 +18,20 @@ import json
 import asyncio
 
 # Import workflow runner
-from workflow import run_workflow, WorkflowInput
+from workflow import run_workflow, WorkflowInput, close_guardrail_client, warm_guardrail_bundles
 
 # Production utilities
-from utils import logger, PerformanceLogger
+from utils import logger, PerformanceLogger, close_session_stores
 from utils.error_handling import register_error_handlers, create_error_response
 from middleware import SecurityMiddleware, rate_limiter
 from routes import health_router
+from services.http_client import close_http_client, get_with_retry
+from services.openai_client import close_openai_client
+from utils.lru_store import LRUStore
+
+# Supabase profile rows per user id / phone, so consecutive chat turns don't repeat the lookup
+# Format: {"id:<uuid>" | "phone:<phone>": {"id", "full_name", "phone"}}
+PROFILE_CACHE: LRUStore[str, Dict[str, Any]] = LRUStore(maxsize=5000, ttl_seconds=60)
 
 # Get environment
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
@@ -76,6 +83,24 @@ register_error_handlers(app)
 # Include health check routes
 app.include_router(health_router)
 
+
+@app.on_event("startup")
+async def warm_workflow_caches():
+    """Build guardrail bundles before the first request instead of on it"""
+    try:
+        warm_guardrail_bundles()
+    except Exception:
+        logger.warning("Guardrail warm-up failed; bundles will be built on first use", exc_info=True)
+
+
+@app.on_event("shutdown")
+async def close_shared_clients():
+    """Release pooled Supabase/OpenAI/Redis connections"""
+    await close_http_client()
+    await close_openai_client()
+    await close_guardrail_client()
+    await close_session_stores()
+
 # Environment variables
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
@@ -183,35 +208,37 @@ async def run_agent_workflow(request: AgentRequest):
 
         if needs_phone_lookup:
             try:
-                import httpx
                 supabase_url = os.getenv("SUPABASE_URL")
                 supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
                 
-                async with httpx.AsyncClient() as client:
-                    # Clean phone number (remove 'whatsapp:' prefix if present)
-                    phone_to_lookup = request.phone or request.user_id
-                    clean_phone = phone_to_lookup.replace('whatsapp:', '').strip()
-                    
-                    # Query profiles table by phone to get UUID
-                    profile_url = f"{supabase_url}/rest/v1/profiles"
-                    headers = {
-                        "apikey": supabase_key,
-                        "Authorization": f"Bearer {supabase_key}"
-                    }
-                    params = {"phone": f"eq.{clean_phone}", "select": "id,full_name,phone"}
-                    
+                # Clean phone number (remove 'whatsapp:' prefix if present)
+                phone_to_lookup = request.phone or request.user_id
+                clean_phone = phone_to_lookup.replace('whatsapp:', '').strip()
+                
+                # Query profiles table by phone to get UUID
+                profile_url = f"{supabase_url}/rest/v1/profiles"
+                headers = {
+                    "apikey": supabase_key,
+                    "Authorization": f"Bearer {supabase_key}"
+                }
+                params = {"phone": f"eq.{clean_phone}", "select": "id,full_name,phone"}
+                
+                profile = PROFILE_CACHE.get(f"phone:{clean_phone}")
+                if profile is None:
                     logger.info(f"🔍 DEBUG: Querying Supabase profiles with phone={clean_phone}")
-                    resp = await client.get(profile_url, headers=headers, params=params)
+                    resp = await get_with_retry(profile_url, headers=headers, params=params, timeout=5.0)
                     logger.info(f"🔍 DEBUG: Profile lookup response status={resp.status_code}, data={resp.text[:300]}")
-                    
                     if resp.is_success and resp.json():
                         profile = resp.json()[0]
-                        resolved_user_id = profile.get("id")  # ← UUID from profiles table
-                        user_name = user_name or profile.get("full_name")
-                        user_phone = profile.get("phone")  # Store phone for listing
-                        logger.info(f"✅ Resolved phone {clean_phone} → UUID: {resolved_user_id}, name: {user_name}, phone: {user_phone}")
-                    else:
-                        logger.warning(f"⚠️ No profile found for phone: {clean_phone}, keeping user_id as-is: {request.user_id}")
+                        PROFILE_CACHE[f"phone:{clean_phone}"] = profile
+
+                if profile:
+                    resolved_user_id = profile.get("id")  # ← UUID from profiles table
+                    user_name = user_name or profile.get("full_name")
+                    user_phone = profile.get("phone")  # Store phone for listing
+                    logger.info(f"✅ Resolved phone {clean_phone} → UUID: {resolved_user_id}, name: {user_name}, phone: {user_phone}")
+                else:
+                    logger.warning(f"⚠️ No profile found for phone: {clean_phone}, keeping user_id as-is: {request.user_id}")
             except Exception as e:
                 logger.error(f"❌ Error resolving user from phone: {str(e)}")
     
@@ -276,40 +303,32 @@ async def web_chat_endpoint(request: AgentRequest):
     supabase_url = os.getenv("SUPABASE_URL")
     supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
     profile_full_name = None
-    owned_listing_ids: list[str] = []
     user_phone = request.user_context.get("phone") if request.user_context else None
 
-    if supabase_url and supabase_key:
+    # Ownership is enforced by the update/delete tools themselves, so only the profile is needed here
+    cached_profile = PROFILE_CACHE.get(f"id:{request.user_id}")
+    if cached_profile is not None:
+        profile_full_name = cached_profile.get("full_name")
+        user_phone = user_phone or cached_profile.get("phone")
+    elif supabase_url and supabase_key:
         try:
-            import httpx
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                # Fetch profile by user_id
-                profile_resp = await client.get(
-                    f"{supabase_url}/rest/v1/profiles",
-                    params={"id": f"eq.{request.user_id}", "select": "full_name, phone"},
-                    headers={
-                        "apikey": supabase_key,
-                        "Authorization": f"Bearer {supabase_key}"
-                    },
-                )
-                if profile_resp.is_success and profile_resp.json():
-                    profile = profile_resp.json()[0]
-                    profile_full_name = profile.get("full_name")
-                    user_phone = user_phone or profile.get("phone")
-
-                # Fetch owned listings for authorization context
-                listings_resp = await client.get(
-                    f"{supabase_url}/rest/v1/listings",
-                    params={"user_id": f"eq.{request.user_id}", "select": "id", "limit": 200},
-                    headers={
-                        "apikey": supabase_key,
-                        "Authorization": f"Bearer {supabase_key}"
-                    },
-                )
-                if listings_resp.is_success:
-                    owned_listing_ids = [item.get("id") for item in listings_resp.json() if item.get("id")]
+            # Fetch profile by user_id
+            profile_resp = await get_with_retry(
+                f"{supabase_url}/rest/v1/profiles",
+                params={"id": f"eq.{request.user_id}", "select": "full_name, phone"},
+                headers={
+                    "apikey": supabase_key,
+                    "Authorization": f"Bearer {supabase_key}"
+                },
+                timeout=10.0,
+            )
+            if profile_resp.is_success and profile_resp.json():
+                profile = profile_resp.json()[0]
+                PROFILE_CACHE[f"id:{request.user_id}"] = profile
+                profile_full_name = profile.get("full_name")
+                user_phone = user_phone or profile.get("phone")
         except Exception as e:
-            logger.error(f"❌ Profile/listings fetch failed: {e}")
+            logger.error(f"❌ Profile fetch failed: {e}")
     
     try:
         async def generate_sse_stream():
@@ -0,0 +1,61 @@
+"""Shared pooled httpx.AsyncClient used by tool modules for Supabase REST calls."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Optional
+
+import httpx
+
+# Per-request timeouts are still passed at call sites; this is only the fallback
+DEFAULT_TIMEOUT = httpx.Timeout(30.0)
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+
+# Reads retry once on timeouts/connection errors/5xx; 4xx is the caller's answer, not a transient fault
+READ_RETRY_ATTEMPTS = 2
+READ_RETRY_BACKOFF_SECONDS = 1.0
+
+logger = logging.getLogger(__name__)
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide AsyncClient, creating it on first use.
+
+    Reusing one client keeps TCP/TLS connections to Supabase alive across tool
+    calls instead of paying a fresh handshake for every request.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, limits=POOL_LIMITS)
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared client (called from the FastAPI shutdown hook)."""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+async def get_with_retry(url: str, *, attempts: int = READ_RETRY_ATTEMPTS, **kwargs: Any) -> httpx.Response:
+    """GET through the shared client, retrying transient failures with linear backoff (1s, 2s, ...).
+
+    After the last attempt the final 5xx response is returned, or the transport error re-raised,
+    so callers keep their existing status/exception handling.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            resp = await get_http_client().get(url, **kwargs)
+        except (httpx.TimeoutException, httpx.NetworkError) as exc:
+            if attempt >= attempts:
+                raise
+            logger.warning("GET %s failed (%s), retry %d/%d", httpx.URL(url).path, type(exc).__name__, attempt, attempts - 1)
+        else:
+            if resp.status_code < 500 or attempt >= attempts:
+                return resp
+            logger.warning("GET %s returned %d, retry %d/%d", httpx.URL(url).path, resp.status_code, attempt, attempts - 1)
+        await asyncio.sleep(READ_RETRY_BACKOFF_SECONDS * attempt)
+    raise RuntimeError("unreachable")  # pragma: no cover
@@ -202,9 +202,8 @@ class SearchComposerAgent:
         title = (item.get("title") or "").strip()
         if not listing_id or not title:
             return None
-        signed_images: List[str] = []
-        if isinstance(item.get("signed_images"), list):
-            signed_images = [str(url) for url in item["signed_images"][:3]]
+        raw_images = item.get("signed_images")
+        signed_images: List[str] = [str(url) for url in raw_images[:3]] if isinstance(raw_images, list) else []
         return ComposerListing(
             id=str(listing_id),
             title=title,
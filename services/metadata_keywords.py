@@ -8,13 +8,21 @@ backend tools and LLM prompts can rely on the same behaviour.
 from __future__ import annotations
 
 from typing import Any, Dict, List, Optional
+import hashlib
 import json
 import re
 
 from loguru import logger
 
+from utils.lru_store import LRUStore
 from .openai_client import get_openai_client
 
+KEYWORDS_MODEL = "gpt-4o-mini"
+
+# Keyword lists per exact prompt (model + system + listing JSON); re-publishing or editing a
+# draft without touching its text fields reuses the previous answer instead of another LLM call
+KEYWORDS_CACHE: LRUStore[str, List[str]] = LRUStore(maxsize=5000, ttl_seconds=3600)
+
 
 def _normalize_keyword(token: str) -> Optional[str]:
     token = (token or "").strip().lower()
@@ -104,10 +112,20 @@ async def generate_listing_keywords(
         f"ILAN_JSON: {json.dumps(payload, ensure_ascii=False)}"
     )
 
+    cache_key = hashlib.sha256(
+        b"\x00".join(part.encode("utf-8") for part in (KEYWORDS_MODEL, system, user))
+    ).hexdigest()
+    cached = KEYWORDS_CACHE.get(cache_key)
+    if isinstance(cached, list):
+        return {
+            "keywords": list(cached),
+            "keywords_text": " ".join(cached),
+        }
+
     try:
         client = get_openai_client()
         resp = await client.chat.completions.create(
-            model="gpt-4o-mini",
+            model=KEYWORDS_MODEL,
             messages=[
                 {"role": "system", "content": system},
                 {"role": "user", "content": user},
@@ -128,6 +146,8 @@ async def generate_listing_keywords(
                 normed.append(kw)
         normed = _dedupe_preserve_order(normed)
         normed = normed[: max(1, int(max_keywords))]
+        if normed:
+            KEYWORDS_CACHE[cache_key] = list(normed)
 
         return {
             "keywords": normed,
@@ -18,3 +18,10 @@ def get_openai_client() -> AsyncOpenAI:
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY is not configured")
     return AsyncOpenAI(api_key=api_key)
+
+
+async def close_openai_client() -> None:
+    """Close the cached client if one was created (called from the FastAPI shutdown hook)."""
+    if get_openai_client.cache_info().currsize:
+        await get_openai_client().close()
+        get_openai_client.cache_clear()
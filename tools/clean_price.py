@@ -1,8 +1,13 @@
 # tools/clean_price.py
 
 import re
+from functools import lru_cache
 from typing import Optional, Dict
 
+# Modül seviyesinde derlenir; her çağrıda re cache araması yapılmaz
+_NON_PRICE_CHARS_RE = re.compile(r"[^\d,.]")
+_THOUSANDS_SEPARATORS = str.maketrans("", "", ",.")
+
 
 def clean_price(price_text: Optional[str]) -> Dict[str, Optional[int]]:
     """
@@ -20,7 +25,12 @@ def clean_price(price_text: Optional[str]) -> Dict[str, Optional[int]]:
     """
     if not price_text:
         return {"clean_price": None}
-    
+    # Sonuç her çağrıda yeni dict; önbellekte yalnızca değişmez int tutulur
+    return {"clean_price": _parse_price(price_text)}
+
+
+@lru_cache(maxsize=1024)
+def _parse_price(price_text: str) -> Optional[int]:
     # Lowercase normalize
     text = price_text.lower().strip()
     
@@ -34,17 +44,15 @@ def clean_price(price_text: Optional[str]) -> Dict[str, Optional[int]]:
         text = text.replace("bin", "")
     
     # Sadece rakam, virgül ve nokta bırak
-    cleaned = re.sub(r"[^\d,.]", "", text)
+    cleaned = _NON_PRICE_CHARS_RE.sub("", text)
     
     # Virgül ve noktayı kaldır (Türkçe: 54.999 veya 54,999 → 54999)
-    cleaned = cleaned.replace(",", "").replace(".", "")
+    cleaned = cleaned.translate(_THOUSANDS_SEPARATORS)
     
     if not cleaned:
-        return {"clean_price": None}
+        return None
     
     try:
-        number = int(cleaned) * multiplier
+        return int(cleaned) * multiplier
     except ValueError:
-        return {"clean_price": None}
-    
-    return {"clean_price": number}
+        return None
@@ -5,6 +5,9 @@ import os
 import httpx
 from typing import Optional
 
+from services.http_client import get_http_client, get_with_retry
+from .search_listings import invalidate_listing_detail
+
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
@@ -46,55 +49,57 @@ async def delete_listing(listing_id: str, user_id: Optional[str] = None) -> dict
     
     try:
         # Ownership check: ensure listing belongs to user_id
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            ownership_resp = await client.get(
-                f"{url}?id=eq.{listing_id}&select=id,user_id",
-                headers={
-                    "apikey": SUPABASE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_KEY}"
-                }
-            )
-            if ownership_resp.is_success and ownership_resp.json():
-                owner = ownership_resp.json()[0].get("user_id")
-                if owner and owner != user_id:
-                    return {
-                        "success": False,
-                        "status_code": 403,
-                        "error": "Bu ilan size ait değil. Başkasının ilanını silemezsiniz."
-                    }
-            else:
+        ownership_resp = await get_with_retry(
+            f"{url}?id=eq.{listing_id}&select=id,user_id",
+            headers={
+                "apikey": SUPABASE_KEY,
+                "Authorization": f"Bearer {SUPABASE_KEY}"
+            },
+            timeout=10.0,
+        )
+        if ownership_resp.is_success and ownership_resp.json():
+            owner = ownership_resp.json()[0].get("user_id")
+            if owner and owner != user_id:
                 return {
                     "success": False,
-                    "status_code": ownership_resp.status_code,
-                    "error": "İlan bulunamadı veya erişim hatası"
+                    "status_code": 403,
+                    "error": "Bu ilan size ait değil. Başkasının ilanını silemezsiniz."
                 }
+        else:
+            return {
+                "success": False,
+                "status_code": ownership_resp.status_code,
+                "error": "İlan bulunamadı veya erişim hatası"
+            }
 
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-            # Supabase delete with filter: DELETE /listings?id=eq.{listing_id}
-            response = await client.delete(
-                f"{url}?id=eq.{listing_id}",
-                headers=headers
-            )
+        # Supabase delete with filter: DELETE /listings?id=eq.{listing_id}
+        response = await get_http_client().delete(
+            f"{url}?id=eq.{listing_id}",
+            headers=headers,
+            timeout=30.0,
+            follow_redirects=True,
+        )
+        
+        if response.status_code in [200, 204]:
+            invalidate_listing_detail(listing_id)
+            return {
+                "success": True,
+                "status_code": response.status_code,
+                "message": f"Listing {listing_id} deleted successfully"
+            }
+        elif response.status_code == 404:
+            return {
+                "success": False,
+                "status_code": 404,
+                "error": f"Listing {listing_id} not found"
+            }
+        else:
+            return {
+                "success": False,
+                "status_code": response.status_code,
+                "error": f"Supabase error: {response.text}"
+            }
             
-            if response.status_code in [200, 204]:
-                return {
-                    "success": True,
-                    "status_code": response.status_code,
-                    "message": f"Listing {listing_id} deleted successfully"
-                }
-            elif response.status_code == 404:
-                return {
-                    "success": False,
-                    "status_code": 404,
-                    "error": f"Listing {listing_id} not found"
-                }
-            else:
-                return {
-                    "success": False,
-                    "status_code": response.status_code,
-                    "error": f"Supabase error: {response.text}"
-                }
-                
     except httpx.ConnectError as e:
         return {
             "success": False,
@@ -8,6 +8,7 @@ import httpx
 from .suggest_category import suggest_category
 from .wallet_tools import deduct_credits
 from services.category_library import normalize_category_id
+from services.http_client import get_http_client
 from services.metadata_keywords import generate_listing_keywords
 
 
@@ -15,25 +16,29 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
 
+# Map metadata types to categories
+METADATA_TYPE_TO_CATEGORY: Dict[str, str] = {
+    "vehicle": "Otomotiv",
+    "property": "Emlak",
+    "electronics": "Elektronik",
+    "phone": "Elektronik",
+    "computer": "Elektronik",
+    "appliance": "Ev & Yaşam",
+    "furniture": "Ev & Yaşam",
+    "clothing": "Moda & Giyim",
+    "general": "Genel"
+}
+
+
 def normalize_category_with_metadata(category: Optional[str], metadata: Optional[Dict[str, Any]]) -> Optional[str]:
     """Force category to align with detected metadata type for consistency."""
-    meta_type = (metadata or {}).get("type") if isinstance(metadata, dict) else None
-    
-    # Map metadata types to categories
-    type_to_category = {
-        "vehicle": "Otomotiv",
-        "property": "Emlak",
-        "electronics": "Elektronik",
-        "phone": "Elektronik",
-        "computer": "Elektronik",
-        "appliance": "Ev & Yaşam",
-        "furniture": "Ev & Yaşam",
-        "clothing": "Moda & Giyim",
-        "general": "Genel"
-    }
-    
-    if meta_type and meta_type in type_to_category:
-        return type_to_category[meta_type]
+    # Fast path: most drafts carry no metadata at all
+    if not metadata or not isinstance(metadata, dict):
+        return category
+
+    meta_type = metadata.get("type")
+    if meta_type and meta_type in METADATA_TYPE_TO_CATEGORY:
+        return METADATA_TYPE_TO_CATEGORY[meta_type]
     
     return category
 
@@ -119,7 +124,7 @@ async def insert_listing(
     category = normalize_category_with_metadata(category, metadata)
     category = normalize_category_id(category) or category or "Diğer"
 
-    normalized_metadata: Dict[str, Any] = metadata.copy() if isinstance(metadata, dict) else {}
+    normalized_metadata: Dict[str, Any] = metadata.copy() if isinstance(metadata, dict) and metadata else {}
 
     keyword_payload = await generate_listing_keywords(
         title=title,
@@ -171,8 +176,7 @@ async def insert_listing(
         print(f"📡 Attempting POST to: {url}")
         print(f"📦 Payload: {payload}")
         
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-            resp = await client.post(url, json=payload, headers=headers)
+        resp = await get_http_client().post(url, json=payload, headers=headers, timeout=30.0, follow_redirects=True)
         
         print(f"✅ Response status: {resp.status_code}")
 
@@ -5,6 +5,8 @@ import os
 import httpx
 from typing import Optional
 
+from services.http_client import get_with_retry
+
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
@@ -54,28 +56,29 @@ async def list_user_listings(
         params["status"] = f"eq.{status}"
     
     try:
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-            response = await client.get(
-                url,
-                params=params,
-                headers=headers
-            )
+        response = await get_with_retry(
+            url,
+            params=params,
+            headers=headers,
+            timeout=30.0,
+            follow_redirects=True,
+        )
+        
+        if response.status_code == 200:
+            listings = response.json()
+            return {
+                "success": True,
+                "status_code": 200,
+                "listings": listings,
+                "count": len(listings)
+            }
+        else:
+            return {
+                "success": False,
+                "status_code": response.status_code,
+                "error": f"Supabase error: {response.text}"
+            }
             
-            if response.status_code == 200:
-                listings = response.json()
-                return {
-                    "success": True,
-                    "status_code": 200,
-                    "listings": listings,
-                    "count": len(listings)
-                }
-            else:
-                return {
-                    "success": False,
-                    "status_code": response.status_code,
-                    "error": f"Supabase error: {response.text}"
-                }
-                
     except httpx.ConnectError as e:
         return {
             "success": False,
@@ -3,10 +3,26 @@ Market Price Snapshot Tool
 Cache'lenmiş piyasa verilerinden benzer ürünleri bulup fiyat tahmini yapar.
 """
 
-from typing import Dict, Any, cast  # type: ignore
+from typing import Dict, Any, Tuple, cast  # type: ignore
+import copy
 import os
 from supabase import create_client, Client
 
+from utils.lru_store import LRUStore
+
+
+# Durum → fiyat katsayısı (her çağrıda yeniden kurulmasın diye modül seviyesinde)
+CONDITION_MULTIPLIERS: Dict[str, float] = {
+    'Sıfır': 1.0,
+    'Az Kullanılmış': 0.85,
+    'İyi Durumda': 0.70,
+    'Orta Durumda': 0.55
+}
+
+# Başarılı tahminler (product_key, kategori, durum, eşik) bazında 10 dk saklanır;
+# aynı popüler ürünler için snapshot tablosunu tekrar taramayız
+MARKET_PRICE_CACHE: LRUStore[Tuple[str, str, str, float], Dict[str, Any]] = LRUStore(maxsize=1024, ttl_seconds=600)
+
 
 def normalize_product_key(title: str, category: str) -> str:
     """Product key normalizasyonu (frontend ile aynı)"""
@@ -74,6 +90,38 @@ def get_market_price_estimate(
 ) -> Dict[str, Any]:
     """
     Cache'lenmiş piyasa verilerinden benzer ürünleri bulup fiyat tahmini yapar.
+    Aynı ürün/kategori/durum için sonuç MARKET_PRICE_CACHE'ten döner (description eşleşmeyi etkilemez).
+    
+    Args:
+        title: Ürün başlığı
+        category: Kategori
+        condition: Ürün durumu
+        description: Ürün açıklaması (opsiyonel)
+        similarity_threshold: Benzerlik eşiği (0-1)
+    
+    Returns:
+        Dict with 'success', 'global_market_price', 'similar_products', 'confidence'
+    """
+    cache_key = (normalize_product_key(title, category), category, condition, float(similarity_threshold))
+    cached = MARKET_PRICE_CACHE.get(cache_key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+    
+    result = _fetch_market_price_estimate(title, category, condition, description, similarity_threshold)
+    if result.get("success"):
+        MARKET_PRICE_CACHE[cache_key] = copy.deepcopy(result)
+    return result
+
+
+def _fetch_market_price_estimate(
+    title: str,
+    category: str,
+    condition: str = "Az Kullanılmış",
+    description: str = "",
+    similarity_threshold: float = 0.5
+) -> Dict[str, Any]:
+    """
+    Snapshot tablosunu tarayıp fiyat tahmini hesaplar (önbelleksiz).
     
     Args:
         title: Ürün başlığı
@@ -174,13 +222,7 @@ def get_market_price_estimate(
         weighted_max = sum(float(m.get('max_price', 0)) * float(m.get('similarity', 0)) for m in top_matches) / total_weight
         
         # Durum katsayısı uygula
-        condition_multipliers = {
-            'Sıfır': 1.0,
-            'Az Kullanılmış': 0.85,
-            'İyi Durumda': 0.70,
-            'Orta Durumda': 0.55
-        }
-        multiplier = condition_multipliers.get(condition, 0.70)
+        multiplier = CONDITION_MULTIPLIERS.get(condition, 0.70)
         
         final_price = int(weighted_avg * multiplier)
         min_price = int(weighted_min * multiplier)
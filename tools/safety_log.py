@@ -1,7 +1,7 @@
 """
 Safety logging helper for vision flags (no auto-ban)
 """
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import os
 from supabase import create_client, Client
 
@@ -21,7 +21,7 @@ def _get_client() -> Client:
     return _supabase
 
 
-def log_image_safety_flag(
+def build_image_safety_flag(
     *,
     user_id: Optional[str],
     image_url: Optional[str],
@@ -33,9 +33,9 @@ def log_image_safety_flag(
     reviewer: Optional[str] = None,
 ) -> Dict[str, Any]:
     """
-    Insert a safety flag row for admin review. Blocking is handled in workflow logic.
+    Row for the image_safety_flags table (see log_image_safety_flags).
     """
-    data: Dict[str, Any] = {
+    return {
         "user_id": user_id,
         "image_url": image_url,
         "flag_type": flag_type,
@@ -45,9 +45,17 @@ def log_image_safety_flag(
         "notes": notes,
         "reviewer": reviewer,
     }
+
+
+def log_image_safety_flags(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Insert several safety flag rows for admin review in one request. Blocking is handled in workflow logic.
+    """
+    if not rows:
+        return {"success": True, "result": []}
     try:
         client = _get_client()
-        result = client.table("image_safety_flags").insert(data).execute()
+        result = client.table("image_safety_flags").insert(rows).execute()
         return {"success": True, "result": result.data}
     except Exception as exc:  # pragma: no cover
-        return {"success": False, "error": str(exc), "data": data}
+        return {"success": False, "error": str(exc), "data": rows}
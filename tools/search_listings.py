@@ -3,11 +3,15 @@
 import os
 import json
 import re
+import time
 from typing import Any, Dict, Optional, List, Iterable, Tuple
 
 import httpx
 from urllib.parse import quote
 
+from services.http_client import get_http_client, get_with_retry
+from utils.lru_store import LRUStore
+
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
@@ -15,6 +19,21 @@ SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 SUPABASE_STORAGE_BUCKET = os.getenv("SUPABASE_STORAGE_BUCKET") or os.getenv("SUPABASE_PUBLIC_BUCKET") or "product-images"
 SUPABASE_STORAGE_PUBLIC = os.getenv("SUPABASE_STORAGE_PUBLIC", "false").lower() in ("1", "true", "yes")
 
+# Signed URLs per (path, expires_in), reused until they are close to expiry so a detail view of a
+# listing that was just shown in search results doesn't sign the same images again
+# Format: {(path, expires_in): (signed_url, monotonic expiry)}
+SIGNED_URL_CACHE: LRUStore[Tuple[str, int], Tuple[str, float]] = LRUStore(maxsize=10000)
+SIGNED_URL_REFRESH_MARGIN_SECONDS = 300
+
+# Successful get_listing_by_id results for back-to-back detail views ("2 nolu ilan" -> "fotoğrafları göster").
+# Short TTL bounds staleness from edits made outside this process; our own update/delete tools invalidate.
+LISTING_DETAIL_CACHE: LRUStore[str, Dict[str, Any]] = LRUStore(maxsize=2000, ttl_seconds=30)
+
+
+def invalidate_listing_detail(listing_id: str) -> None:
+    """Drop a cached detail view after the listing was updated or deleted."""
+    LISTING_DETAIL_CACHE.pop(str(listing_id or "").strip(), None)
+
 
 async def generate_signed_urls(paths: List[str], expires_in: int = 3600) -> Dict[str, str]:
     """
@@ -34,22 +53,33 @@ async def generate_signed_urls(paths: List[str], expires_in: int = 3600) -> Dict
     if SUPABASE_STORAGE_PUBLIC:
         return {p: f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_STORAGE_BUCKET}/{quote(p)}" for p in paths}
 
+    signed_map: Dict[str, str] = {}
+    now = time.monotonic()
+    to_sign: List[str] = []
+    for p in paths:
+        cached = SIGNED_URL_CACHE.get((p, expires_in))
+        if cached is not None and cached[1] - now > SIGNED_URL_REFRESH_MARGIN_SECONDS:
+            signed_map[p] = cached[0]
+        else:
+            to_sign.append(p)
+    if not to_sign:
+        return signed_map
+
     sign_url = f"{SUPABASE_URL}/storage/v1/object/sign/{SUPABASE_STORAGE_BUCKET}"
     headers = {
         "apikey": SUPABASE_SERVICE_KEY,
         "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
         "Content-Type": "application/json",
     }
-    payload = {"paths": paths, "expiresIn": expires_in}
+    payload = {"paths": to_sign, "expiresIn": expires_in}
 
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(sign_url, json=payload, headers=headers)
+        resp = await get_http_client().post(sign_url, json=payload, headers=headers, timeout=30.0)
         if not resp.is_success:
-            return {}
+            return signed_map
         data = resp.json() or []
         # Supabase returns list of objects with {signedURL, path}
-        signed_map: Dict[str, str] = {}
+        expires_at = now + expires_in
         for item in data:
             signed_url = item.get("signedURL")
             path = item.get("path")
@@ -57,19 +87,22 @@ async def generate_signed_urls(paths: List[str], expires_in: int = 3600) -> Dict
                 continue
             # Use as returned (already URL-safe); prepend base
             signed_map[path] = f"{SUPABASE_URL}{signed_url}"
+            SIGNED_URL_CACHE[(path, expires_in)] = (signed_map[path], expires_at)
         return signed_map
     except Exception:
-        return {}
+        return signed_map
 
 
 def _extract_keyword_tokens(text: str, *, limit: int = 4) -> List[str]:
     tokens = [tok.lower() for tok in re.findall(r"[0-9a-zA-ZçğıöşüÇĞİÖŞÜ]+", text or "")]
     filtered: List[str] = []
+    seen: set[str] = set()
     for tok in tokens:
         if len(tok) < 3:
             continue
-        if tok in filtered:
+        if tok in seen:
             continue
+        seen.add(tok)
         filtered.append(tok)
         if len(filtered) >= limit:
             break
@@ -221,8 +254,7 @@ async def search_listings(
     }
 
     try:
-        async with httpx.AsyncClient(timeout=45.0) as client:
-            resp = await client.get(url, params=params, headers=headers)
+        resp = await get_with_retry(url, params=params, headers=headers, timeout=45.0)
 
         if not resp.is_success:
             return {
@@ -382,6 +414,10 @@ async def get_listing_by_id(listing_id: str) -> Dict[str, Any]:
             "error": "missing_listing_id",
         }
 
+    cached = LISTING_DETAIL_CACHE.get(listing_id_s)
+    if cached is not None:
+        return {"success": True, "result": dict(cached)}
+
     url = f"{SUPABASE_URL}/rest/v1/listings"
     select_fields = ",".join(
         [
@@ -484,8 +520,7 @@ async def get_listing_by_id(listing_id: str) -> Dict[str, Any]:
         return out
 
     try:
-        async with httpx.AsyncClient(timeout=45.0) as client:
-            resp = await client.get(url, params=params, headers=headers)
+        resp = await get_with_retry(url, params=params, headers=headers, timeout=45.0)
 
         if not resp.is_success:
             return {
@@ -517,8 +552,7 @@ async def get_listing_by_id(listing_id: str) -> Dict[str, Any]:
         extracted = _extract_public_fields_from_metadata(meta)
         if extracted:
             item.update(extracted)
-        if "metadata" in item:
-            item.pop("metadata", None)
+        item.pop("metadata", None)
 
         # Sign images
         refs = _collect_listing_image_refs(item)
@@ -544,6 +578,7 @@ async def get_listing_by_id(listing_id: str) -> Dict[str, Any]:
         item["signed_images"] = signed_images
         item["first_image_signed_url"] = signed_images[0] if signed_images else None
 
+        LISTING_DETAIL_CACHE[listing_id_s] = dict(item)
         return {
             "success": True,
             "result": item,
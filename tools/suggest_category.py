@@ -24,6 +24,12 @@ CATEGORY_KEYWORDS = {
     "Ev & Yaşam": ["mutfak", "tencere", "tabak", "çanak", "dekorasyon", "vazo", "lamba", "halı", "perde", "ev tekstili"],
 }
 
+# (keyword, lowercased keyword) pairs, built once: every insert/update validates its category through here
+_CATEGORY_KEYWORD_PAIRS = {
+    category: tuple((keyword, keyword.lower()) for keyword in keywords)
+    for category, keywords in CATEGORY_KEYWORDS.items()
+}
+
 
 async def suggest_category(
     title: str,
@@ -54,16 +60,10 @@ async def suggest_category(
     scores = {}
     matched_keywords = {}
     
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        score = 0
-        matches = []
-        for keyword in keywords:
-            if keyword.lower() in text:
-                score += 1
-                matches.append(keyword)
-        
-        if score > 0:
-            scores[category] = score
+    for category, keyword_pairs in _CATEGORY_KEYWORD_PAIRS.items():
+        matches = [keyword for keyword, lowered in keyword_pairs if lowered in text]
+        if matches:
+            scores[category] = len(matches)
             matched_keywords[category] = matches
     
     # No matches found – fall back to deterministic classifier
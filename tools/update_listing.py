@@ -5,6 +5,8 @@ import os
 import httpx
 from typing import Optional, List
 from .suggest_category import suggest_category
+from services.http_client import get_http_client, get_with_retry
+from .search_listings import invalidate_listing_detail
 
 
 def normalize_category_with_metadata(category: Optional[str], metadata: Optional[dict]) -> Optional[str]:
@@ -53,6 +55,9 @@ def normalize_metadata_type_with_category(metadata: Optional[dict], category: Op
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
+# Column order matches the value tuple zipped in update_listing (images is handled separately)
+PATCHABLE_FIELDS = ("title", "price", "condition", "category", "description", "location", "stock", "status", "metadata")
+
 async def update_listing(
     listing_id: str,
     user_id: Optional[str] = None,
@@ -107,25 +112,14 @@ async def update_listing(
         }
     
     # Build payload with only provided fields
-    payload = {}
-    if title is not None:
-        payload["title"] = title
-    if price is not None:
-        payload["price"] = price
-    if condition is not None:
-        payload["condition"] = condition
-    if category is not None:
-        payload["category"] = category
-    if description is not None:
-        payload["description"] = description
-    if location is not None:
-        payload["location"] = location
-    if stock is not None:
-        payload["stock"] = stock
-    if status is not None:
-        payload["status"] = status
-    if metadata is not None:
-        payload["metadata"] = metadata
+    payload = {
+        key: value
+        for key, value in zip(
+            PATCHABLE_FIELDS,
+            (title, price, condition, category, description, location, stock, status, metadata),
+        )
+        if value is not None
+    }
     if images is not None:
         payload["images"] = images
         if images:
@@ -146,18 +140,18 @@ async def update_listing(
             validation_description = description
 
             if validation_title is None or validation_description is None:
-                async with httpx.AsyncClient(timeout=10.0) as client:
-                    fetch_resp = await client.get(
-                        f"{SUPABASE_URL}/rest/v1/listings?id=eq.{listing_id}&select=title,description",
-                        headers={
-                            "apikey": SUPABASE_KEY,
-                            "Authorization": f"Bearer {SUPABASE_KEY}"
-                        }
-                    )
-                    if fetch_resp.is_success and fetch_resp.json():
-                        current = fetch_resp.json()[0]
-                        validation_title = validation_title or current.get("title")
-                        validation_description = validation_description or current.get("description")
+                fetch_resp = await get_with_retry(
+                    f"{SUPABASE_URL}/rest/v1/listings?id=eq.{listing_id}&select=title,description",
+                    headers={
+                        "apikey": SUPABASE_KEY,
+                        "Authorization": f"Bearer {SUPABASE_KEY}"
+                    },
+                    timeout=10.0,
+                )
+                if fetch_resp.is_success and fetch_resp.json():
+                    current = fetch_resp.json()[0]
+                    validation_title = validation_title or current.get("title")
+                    validation_description = validation_description or current.get("description")
 
             if validation_title:
                 suggestion = await suggest_category(validation_title, validation_description, category)
@@ -182,51 +176,53 @@ async def update_listing(
     
     try:
         # Ownership check: ensure listing belongs to user_id
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            ownership_resp = await client.get(
-                f"{url}?id=eq.{listing_id}&select=id,user_id",
-                headers={
-                    "apikey": SUPABASE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_KEY}"
-                }
-            )
-            if ownership_resp.is_success and ownership_resp.json():
-                owner = ownership_resp.json()[0].get("user_id")
-                if owner and owner != user_id:
-                    return {
-                        "success": False,
-                        "status_code": 403,
-                        "error": "Bu ilan size ait değil. Başkasının ilanını güncelleyemezsiniz."
-                    }
-            else:
+        ownership_resp = await get_with_retry(
+            f"{url}?id=eq.{listing_id}&select=id,user_id",
+            headers={
+                "apikey": SUPABASE_KEY,
+                "Authorization": f"Bearer {SUPABASE_KEY}"
+            },
+            timeout=10.0,
+        )
+        if ownership_resp.is_success and ownership_resp.json():
+            owner = ownership_resp.json()[0].get("user_id")
+            if owner and owner != user_id:
                 return {
                     "success": False,
-                    "status_code": ownership_resp.status_code,
-                    "error": "İlan bulunamadı veya erişim hatası"
+                    "status_code": 403,
+                    "error": "Bu ilan size ait değil. Başkasının ilanını güncelleyemezsiniz."
                 }
+        else:
+            return {
+                "success": False,
+                "status_code": ownership_resp.status_code,
+                "error": "İlan bulunamadı veya erişim hatası"
+            }
 
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-            # Supabase update with filter: PATCH /listings?id=eq.{listing_id}
-            response = await client.patch(
-                f"{url}?id=eq.{listing_id}",
-                json=payload,
-                headers=headers
-            )
+        # Supabase update with filter: PATCH /listings?id=eq.{listing_id}
+        response = await get_http_client().patch(
+            f"{url}?id=eq.{listing_id}",
+            json=payload,
+            headers=headers,
+            timeout=30.0,
+            follow_redirects=True,
+        )
+        
+        if response.status_code in [200, 201, 204]:
+            invalidate_listing_detail(listing_id)
+            result = response.json() if response.text else {"listing_id": listing_id}
+            return {
+                "success": True,
+                "status_code": response.status_code,
+                "result": result if result else {"listing_id": listing_id, "updated": True}
+            }
+        else:
+            return {
+                "success": False,
+                "status_code": response.status_code,
+                "error": f"Supabase error: {response.text}"
+            }
             
-            if response.status_code in [200, 201, 204]:
-                result = response.json() if response.text else {"listing_id": listing_id}
-                return {
-                    "success": True,
-                    "status_code": response.status_code,
-                    "result": result if result else {"listing_id": listing_id, "updated": True}
-                }
-            else:
-                return {
-                    "success": False,
-                    "status_code": response.status_code,
-                    "error": f"Supabase error: {response.text}"
-                }
-                
     except httpx.ConnectError as e:
         return {
             "success": False,
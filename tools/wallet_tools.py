@@ -23,6 +23,8 @@ from typing import Dict, Any
 from supabase import create_client, Client
 from datetime import datetime, timedelta
 
+from .search_listings import invalidate_listing_detail
+
 
 def get_supabase_client() -> Client:
     """Get authenticated Supabase client"""
@@ -219,6 +221,7 @@ def add_premium_to_listing(
                 "success": False,
                 "error": "Listing not found or update failed"
             }
+        invalidate_listing_detail(listing_id)
         
         return {
             "success": True,
@@ -390,6 +393,7 @@ def renew_listing(
         response = supabase.table("listings").update({
             "expires_at": new_expires.isoformat()
         }).eq("id", listing_id).execute()
+        invalidate_listing_detail(listing_id)
         
         return {
             "success": True,
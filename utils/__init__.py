@@ -1,4 +1,6 @@
 """Utilities package"""
 from .logging_config import logger, PerformanceLogger, setup_logging
+from .lru_store import LRUStore
+from .session_store import SessionStore, close_session_stores, make_session_store
 
-__all__ = ["logger", "PerformanceLogger", "setup_logging"]
+__all__ = ["logger", "PerformanceLogger", "setup_logging", "LRUStore", "SessionStore", "close_session_stores", "make_session_store"]
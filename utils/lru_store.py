@@ -0,0 +1,59 @@
+"""
+Bounded in-memory key/value store
+- LRU eviction once maxsize is reached
+- Optional per-entry TTL
+- dict-compatible (get / [] / pop / in) so it can replace module-level dict stores
+"""
+import time
+from collections import OrderedDict
+from typing import Generic, Iterator, MutableMapping, Optional, Tuple, TypeVar
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class LRUStore(MutableMapping[K, V], Generic[K, V]):
+    """Dict-like store that evicts the least recently used key (use Redis for multi-worker setups)"""
+
+    def __init__(self, maxsize: int, ttl_seconds: Optional[float] = None):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds
+
+    def __getitem__(self, key: K) -> V:
+        stored_at, value = self._data[key]
+        if self._expired(stored_at):
+            del self._data[key]
+            raise KeyError(key)
+        self._data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: K, value: V) -> None:
+        if key in self._data:
+            self._data.move_to_end(key)
+        self._data[key] = (time.monotonic(), value)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __delitem__(self, key: K) -> None:
+        del self._data[key]
+
+    def __contains__(self, key: object) -> bool:
+        entry = self._data.get(key)  # type: ignore[arg-type]
+        if entry is None:
+            return False
+        if self._expired(entry[0]):
+            del self._data[key]  # type: ignore[arg-type]
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(list(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,111 @@
+"""
+Per-user session stores shared across worker processes
+- SessionStore: awaited get / set / delete, JSON values, per-key TTL
+- Backed by redis.asyncio when REDIS_URL is set, by an in-process LRUStore otherwise
+- Redis errors never fail a turn: the store logs and falls back to its LRUStore
+"""
+import json
+import logging
+import os
+from typing import Any, Generic, Optional, TypeVar
+
+from .lru_store import LRUStore
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:  # optional dependency; single-worker deployments don't need it
+    aioredis = None  # type: ignore[assignment]
+
+    class RedisError(Exception):  # type: ignore[no-redef]
+        """Stand-in so the except clauses below resolve without the redis package"""
+
+V = TypeVar("V")
+
+REDIS_URL = os.getenv("REDIS_URL", "").strip()
+REDIS_SOCKET_TIMEOUT_SECONDS = 2.0
+
+logger = logging.getLogger(__name__)
+
+_redis_client: Optional["aioredis.Redis"] = None
+
+
+def _get_redis_client() -> Optional["aioredis.Redis"]:
+    """Shared async client; connections are opened lazily on the first command, not at import."""
+    global _redis_client
+    if _redis_client is not None or not REDIS_URL:
+        return _redis_client
+    if aioredis is None:
+        logger.warning("REDIS_URL is set but the redis package is not installed; using in-process session stores")
+        return None
+    _redis_client = aioredis.Redis.from_url(
+        REDIS_URL,
+        socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+    )
+    return _redis_client
+
+
+async def close_session_stores() -> None:
+    """Close the shared Redis client (called from the FastAPI shutdown hook)."""
+    global _redis_client
+    if _redis_client is not None:
+        await _redis_client.aclose()
+    _redis_client = None
+
+
+class SessionStore(Generic[V]):
+    """One key namespace in Redis, or a bounded in-process LRUStore when Redis is unavailable"""
+
+    def __init__(self, namespace: str, maxsize: int, ttl_seconds: Optional[float] = None):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        # Sole backend without Redis; fallback for reads/writes while Redis is erroring
+        self.local: LRUStore[str, V] = LRUStore(maxsize=maxsize, ttl_seconds=ttl_seconds)
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _ttl(self) -> Optional[int]:
+        return max(1, int(self.ttl_seconds)) if self.ttl_seconds else None
+
+    def _redis_failed(self, op: str) -> None:
+        logger.warning("Redis %s on %s failed; using in-process store", op, self.namespace, exc_info=True)
+
+    async def get(self, key: str, default: Optional[V] = None) -> Optional[V]:
+        client = _get_redis_client()
+        if client is not None:
+            try:
+                raw = await client.get(self._key(key))
+            except RedisError:
+                self._redis_failed("GET")
+            else:
+                if raw is not None:
+                    return json.loads(raw)
+        # Without Redis, on a Redis error, or for a value written while Redis was down
+        return self.local.get(key, default)
+
+    async def set(self, key: str, value: V) -> None:
+        client = _get_redis_client()
+        if client is not None:
+            try:
+                await client.set(self._key(key), json.dumps(value, ensure_ascii=False, default=str), ex=self._ttl())
+                return
+            except RedisError:
+                self._redis_failed("SET")
+        self.local[key] = value
+
+    async def delete(self, key: str) -> None:
+        client = _get_redis_client()
+        if client is not None:
+            try:
+                await client.delete(self._key(key))
+            except RedisError:
+                self._redis_failed("DEL")
+        # Also drop any copy written while Redis was down
+        self.local.pop(key, None)
+
+
+def make_session_store(namespace: str, maxsize: int, ttl_seconds: Optional[float] = None) -> SessionStore[Any]:
+    """Shared Redis store when configured, otherwise a bounded per-process LRUStore"""
+    return SessionStore(namespace, maxsize=maxsize, ttl_seconds=ttl_seconds)
@@ -57,20 +57,27 @@ TODO: Implement after Phase 3 (Listing Management) is complete.
 ============================================================
 """
 # pyright: reportUnknownVariableType=false, reportUnknownMemberType=false, reportUnknownParameterType=false, reportUnknownArgumentType=false, reportMissingParameterType=false, reportMissingTypeArgument=false
+import ast
+import asyncio
+import hashlib
+import json
+import logging
 import os
+import random
 import re
 import time
-import uuid
 from contextvars import ContextVar
 from dataclasses import dataclass, field
+from functools import lru_cache
 from agents import Agent, AgentOutputSchema, ModelSettings, TResponseInputItem, Runner, RunConfig, trace
 from agents.tool import function_tool
-from openai import AsyncOpenAI
-from types import SimpleNamespace
+import httpx
+from openai import AsyncOpenAI, APIConnectionError, RateLimitError
+from types import MappingProxyType
 from guardrails.runtime import load_config_bundle, instantiate_guardrails, run_guardrails
 from pydantic import BaseModel
 from openai.types.shared.reasoning import Reasoning
-from typing import Optional, Dict, Any, List, Iterable, Callable, Awaitable, cast
+from typing import Optional, Dict, Any, List, AsyncIterator, Iterable, Iterator, Callable, Awaitable, Coroutine, Literal, Mapping, NamedTuple, Sequence, Set, Tuple, cast
 
 # Import tool implementations
 from tools.clean_price import clean_price
@@ -79,7 +86,7 @@ from tools.search_listings import search_listings, get_listing_by_id
 from tools.update_listing import update_listing as _update_listing
 from tools.delete_listing import delete_listing as _delete_listing
 from tools.list_user_listings import list_user_listings as _list_user_listings
-from tools.safety_log import log_image_safety_flag
+from tools.safety_log import build_image_safety_flag, log_image_safety_flags
 from tools.market_price_tool import get_market_price_estimate
 from tools.wallet_tools import (
     get_wallet_balance,
@@ -90,7 +97,12 @@ from tools.wallet_tools import (
     renew_listing
 )
 from tools.admin_tools import admin_add_credits, admin_grant_premium
+from services.http_client import get_http_client
 from services.listing_search import SearchComposerAgent
+from utils.lru_store import LRUStore
+from utils.session_store import SessionStore, make_session_store
+
+logger = logging.getLogger(__name__)
 
 
 UpdateListingFn = Callable[..., Awaitable[Dict[str, Any]]]
@@ -104,17 +116,15 @@ list_user_listings: ListUserListingsFn = cast(ListUserListingsFn, _list_user_lis
 # Supabase public bucket info for constructing vision-safe URLs
 SUPABASE_URL = os.getenv("SUPABASE_URL", "").rstrip("/")
 SUPABASE_PUBLIC_BUCKET = os.getenv("SUPABASE_PUBLIC_BUCKET", "product-images").strip("/")
+# Env is fixed per process, so the public object prefix is built once
+SUPABASE_PUBLIC_PREFIX = f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_PUBLIC_BUCKET}/" if SUPABASE_URL else ""
 
 
 def _resolve_public_image_url(path: str) -> str:
     """Convert stored path to public URL for vision model access."""
-    if not path:
-        return path
-    if path.startswith("http://") or path.startswith("https://"):
-        return path
-    if not SUPABASE_URL:
+    if not path or not SUPABASE_PUBLIC_PREFIX or path.startswith(("http://", "https://")):
         return path
-    return f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_PUBLIC_BUCKET}/{path.lstrip('/')}"
+    return SUPABASE_PUBLIC_PREFIX + path.lstrip("/")
 
 
 @dataclass
@@ -175,20 +185,66 @@ def resolve_conversation_state() -> Dict[str, Any]:
     return ctx.conversation_state if ctx and ctx.conversation_state else {}
 
 
+class ResolvedContext(NamedTuple):
+    """All resolver outputs from a single WORKFLOW_CONTEXT read."""
+    user_id: Optional[str]
+    user_name: Optional[str]
+    user_phone: Optional[str]
+    auth_context: Dict[str, Any]
+    conversation_state: Dict[str, Any]
+
+
+def resolve_all() -> ResolvedContext:
+    """Same results as the individual resolve_* helpers (without explicit overrides), one ContextVar read."""
+    ctx = get_workflow_context()
+    if not ctx:
+        return ResolvedContext(None, None, None, {}, {})
+    auth_ctx = ctx.auth_context or {}
+    return ResolvedContext(
+        user_id=auth_ctx.get("user_id") or ctx.user_id,
+        user_name=ctx.user_name,
+        user_phone=auth_ctx.get("phone") or ctx.user_phone,
+        auth_context=auth_ctx,
+        conversation_state=ctx.conversation_state or {},
+    )
+
+
 def _is_uuid(value: Optional[str]) -> bool:
+    """Cheap canonical-UUID check (8-4-4-4-12 hex) without constructing uuid.UUID."""
     if not value:
         return False
+    s = value if isinstance(value, str) else str(value)
+    if len(s) != 36 or s[8] != "-" or s[13] != "-" or s[18] != "-" or s[23] != "-":
+        return False
+    hex_part = s[0:8] + s[9:13] + s[14:18] + s[19:23] + s[24:]
+    # int() also accepts signs, underscores and non-ASCII digits; reject those up front
+    if not (hex_part.isascii() and hex_part.isalnum()):
+        return False
     try:
-        uuid.UUID(str(value))
+        int(hex_part, 16)
         return True
-    except Exception:
+    except ValueError:
         return False
 
 
+UUID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.IGNORECASE)
+
+# Listing-number patterns in priority order (earlier pattern wins over later ones)
+LISTING_NUMBER_PATTERNS = (
+    r"\b(\d{1,3})\s*(?:nolu|no\.?|numaral[ıi])\s*ilan(?:ın|in|ı|i|u|ü|un|nun)?\b",
+    r"\b(\d{1,3})\s*(?:nolu|no\.?|numara|numaral[ıi])\b",
+    r"\bilan(?:ın|in|ı|i|u|ü)?\s*(?:#|numara|no)?\s*(\d{1,3})\b",
+    r"#\s*(\d{1,3})\b",
+)
+# All patterns fused into one zero-width lookahead so the text is scanned once.
+# Lookahead keeps matches overlapping; group i (m.lastindex) is pattern i.
+LISTING_NUMBER_RE = re.compile("(?=" + "|".join(f"(?:{p})" for p in LISTING_NUMBER_PATTERNS) + ")")
+
+
 def _extract_uuid(text: str) -> Optional[str]:
     if not text:
         return None
-    match = re.search(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}", text)
+    match = UUID_RE.search(text)
     return match.group(0) if match else None
 
 
@@ -196,23 +252,18 @@ def _extract_listing_number(text: str) -> Optional[int]:
     """Best-effort parse for Turkish patterns like '1 nolu ilan', 'ilan #2', '2 numaralı ilan'."""
     if not text:
         return None
-    lowered = text.casefold()
-    patterns = [
-        r"\b(\d{1,3})\s*(?:nolu|no\.?|numaral[ıi])\s*ilan(?:ın|in|ı|i|u|ü|un|nun)?\b",
-        r"\b(\d{1,3})\s*(?:nolu|no\.?|numara|numaral[ıi])\b",
-        r"\bilan(?:ın|in|ı|i|u|ü)?\s*(?:#|numara|no)?\s*(\d{1,3})\b",
-        r"#\s*(\d{1,3})\b",
-    ]
-    for pat in patterns:
-        m = re.search(pat, lowered)
-        if not m:
-            continue
-        try:
-            num = int(m.group(1))
-            return num if num > 0 else None
-        except Exception:
-            continue
-    return None
+    best_rank = 0
+    best_digits = ""
+    for m in LISTING_NUMBER_RE.finditer(text.casefold()):
+        rank = m.lastindex or 0
+        if not best_rank or rank < best_rank:
+            best_rank, best_digits = rank, m.group(rank)
+            if rank == 1:
+                break
+    if not best_rank:
+        return None
+    num = int(best_digits)
+    return num if num > 0 else None
 
 
 def _get_search_session(user_key: str) -> Optional[Dict[str, Any]]:
@@ -235,6 +286,32 @@ def _clear_search_session(user_key: str) -> None:
     USER_SEARCH_SESSION_STORE.pop(user_key, None)
 
 
+async def _set_active_listing(user_key: str, listing_id: str, state: Optional[Dict[str, Any]] = None) -> None:
+    """Persist the selected listing for the user and mirror it into conversation_state."""
+    await USER_ACTIVE_LISTING_STORE.set(user_key, listing_id)
+    if isinstance(state, dict):
+        state["active_listing_id"] = listing_id
+
+
+# Turkish diacritic folding so "goster"/"göster", "detayini"/"detayını" match the same keyword.
+# U+0307 is the combining dot that "İ".lower() leaves behind.
+_TR_FOLD = str.maketrans({"ç": "c", "ğ": "g", "ı": "i", "ö": "o", "ş": "s", "ü": "u", "\u0307": None})
+
+
+def _fold_tr(text: str) -> str:
+    return (text or "").lower().translate(_TR_FOLD)
+
+
+def _compile_keyword_pattern(keywords: Iterable[str]) -> "re.Pattern[str]":
+    """Fold a keyword tuple into one alternation so a message is scanned once, not once per keyword.
+
+    Keywords are diacritic-folded; match against `_fold_tr(text)`.
+    """
+    # Longest first so overlapping phrases ("detayını" vs "detay") resolve the same way on every build
+    ordered = sorted({_fold_tr(k) for k in keywords}, key=len, reverse=True)
+    return re.compile("|".join(re.escape(k) for k in ordered))
+
+
 SHOW_MORE_KEYWORDS = (
     "daha fazla",
     "devamını",
@@ -248,9 +325,11 @@ SHOW_MORE_KEYWORDS = (
 )
 
 
+SHOW_MORE_RE = _compile_keyword_pattern(SHOW_MORE_KEYWORDS)
+
+
 def _is_show_more_request(text: str) -> bool:
-    lowered = (text or "").strip().lower()
-    return any(keyword in lowered for keyword in SHOW_MORE_KEYWORDS)
+    return SHOW_MORE_RE.search(_fold_tr(text)) is not None
 
 
 DETAIL_COMMAND_HINTS = (
@@ -267,6 +346,156 @@ DETAIL_COMMAND_HINTS = (
     "ayrıntı",
     "ayrinti",
 )
+DETAIL_COMMAND_RE = _compile_keyword_pattern(DETAIL_COMMAND_HINTS)
+
+
+SMALL_TALK_GREETING_RESPONSE = (
+    "Selam{name}! 👋 PazarGlobal'e hoş geldiniz!\n\n"
+    "🛒 Ürün satmak istiyorsanız: Satmak istediğiniz ürünün adını ve temel özelliklerini yazın.\n\n"
+    "🔍 Ürün aramak istiyorsanız: Ne tür bir ürün aradığınızı söyleyin.\n\n"
+    "Bugün PazarGlobal'de ne yapmak istersiniz, ürün mü satacaksınız yoksa bir şey mi arıyorsunuz?"
+)
+SMALL_TALK_THANKS_RESPONSE = "Rica ederim{name}! Başka bir konuda yardımcı olabilir miyim?"
+# Fixed reply for cancel turns; no agent runs for them
+CANCEL_RESPONSE = (
+    "🔄 İşlem iptal edildi.\n\n"
+    "Yeni bir işlem için:\n"
+    "• Ürün satmak: Ürün bilgilerini yazın.\n"
+    "• Ürün aramak: Ne aradığınızı söyleyin."
+)
+
+# Canonical small_talk replies served without an LLM call (keys are normalized user text)
+SMALL_TALK_CANNED_RESPONSES: Dict[str, str] = {
+    "merhaba": SMALL_TALK_GREETING_RESPONSE,
+    "merhabalar": SMALL_TALK_GREETING_RESPONSE,
+    "selam": SMALL_TALK_GREETING_RESPONSE,
+    "selamlar": SMALL_TALK_GREETING_RESPONSE,
+    "teşekkürler": SMALL_TALK_THANKS_RESPONSE,
+    "tesekkurler": SMALL_TALK_THANKS_RESPONSE,
+    "teşekkür ederim": SMALL_TALK_THANKS_RESPONSE,
+    "tesekkur ederim": SMALL_TALK_THANKS_RESPONSE,
+    "sağol": SMALL_TALK_THANKS_RESPONSE,
+    "sağ ol": SMALL_TALK_THANKS_RESPONSE,
+    "sagol": SMALL_TALK_THANKS_RESPONSE,
+    "nasılsın": "İyiyim{name}, teşekkürler! Bugün ürün mü satacaksın, yoksa bir şey mi arıyorsun?",
+    "nasilsin": "İyiyim{name}, teşekkürler! Bugün ürün mü satacaksın, yoksa bir şey mi arıyorsun?",
+}
+
+
+def _canned_small_talk_response(text: str, user_name: Optional[str] = None) -> Optional[str]:
+    key = (text or "").strip().lower().rstrip("!.?")
+    template = SMALL_TALK_CANNED_RESPONSES.get(key)
+    if template is None:
+        return None
+    first_name = (user_name or "").strip().split(" ")[0]
+    return template.format(name=f" {first_name}" if first_name else "")
+
+
+# Deterministic router fast-path (keywords from the Router Agent rulebook).
+# Only unambiguous hits outside draft/preview/published context skip the gpt-4o classifier.
+FAST_ROUTE_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "create_listing": ("satıyorum", "satmak istiyorum", "satayım", "ilan vermek", "ilan ver"),
+    "update_listing": ("ilanlarım", "bana ait ilanlar", "benim ilanlar", "güncelle", "düzenle"),
+    "delete_listing": ("ilanımı sil", "ilanımı kaldır"),
+    "search_product": ("arıyorum", "almak istiyorum", "satın al", "tüm ilanlar", "bütün ilanlar", "sitedeki ilanlar"),
+}
+FAST_ROUTE_RES: Dict[str, "re.Pattern[str]"] = {
+    intent: re.compile(r"\b(?:" + "|".join(re.escape(_fold_tr(k)) for k in sorted(keywords, key=len, reverse=True)) + ")")
+    for intent, keywords in FAST_ROUTE_KEYWORDS.items()
+}
+# Whole-message matches (after folding and trailing punctuation strip)
+FAST_ROUTE_EXACT: Dict[str, str] = {
+    **{_fold_tr(k): "small_talk" for k in SMALL_TALK_CANNED_RESPONSES},
+    **{_fold_tr(k): "cancel" for k in ("iptal", "iptal et", "vazgeç", "vazgeçtim", "sıfırla", "cancel")},
+}
+# Headers of every draft preview template (ListingAgent's "✨ İlanınız hazır" and the older "📝 İlan önizlemesi")
+DRAFT_PREVIEW_MARKERS = ("📝 İlan önizlemesi", "✨ İlanınız hazır")
+CONFIRMABLE_PREVIEW_MARKERS = (*DRAFT_PREVIEW_MARKERS, "✅ Onaylamak için")
+LISTING_CONTEXT_MARKERS = (*CONFIRMABLE_PREVIEW_MARKERS, "İlan yayınlandı", "preview")
+# Bare confirmations right after a draft preview are publish_listing per the Router rulebook
+FAST_ROUTE_CONFIRM = frozenset(_fold_tr(k) for k in ("onayla", "onaylıyorum", "yayınla", "evet yayınla", "evet onayla"))
+
+
+def _fast_route_intent(text: str, raw_hist: Any) -> Optional[str]:
+    """Return an intent when the message alone decides it; None defers to the Router Agent."""
+    folded = _fold_tr(text).strip().rstrip("!.?")
+    if not folded:
+        return None
+    exact = FAST_ROUTE_EXACT.get(folded)
+    if exact:
+        return exact
+    # Draft/published context changes what "değiştir"/"onayla" mean; leave those turns to the classifier,
+    # except a bare confirmation whose latest assistant reply is still the draft preview
+    if folded in FAST_ROUTE_CONFIRM:
+        for msg in reversed(raw_hist or ()):
+            if isinstance(msg, dict) and msg.get("role") == "assistant" and isinstance(msg.get("content"), str):
+                return "publish_listing" if any(m in msg["content"] for m in CONFIRMABLE_PREVIEW_MARKERS) else None
+        return None
+    for msg in (raw_hist or ()):
+        content = msg.get("content") if isinstance(msg, dict) else None
+        if isinstance(content, str) and any(marker in content for marker in LISTING_CONTEXT_MARKERS):
+            return None
+    matched = [intent for intent, pattern in FAST_ROUTE_RES.items() if pattern.search(folded)]
+    return matched[0] if len(matched) == 1 else None
+
+
+# Plain balance questions ("bakiyem ne kadar", "kredim kaç") are answered directly from the wallet.
+# Only short messages made entirely of balance words and question fillers qualify, so "kredi ile araba
+# satmak istiyorum" or "param yok ama bisiklet arıyorum" keep their real intent; history/transaction
+# questions ("işlemlerim", "geçmiş") still go through PublishAgent and its transaction tool.
+WALLET_BALANCE_QUERY_RE = re.compile(
+    r"(?:bakiye(?:m|mi|miz|mizi)?|kredi(?:m|mi|ler|lerim|lerimi)?|param|parami|cuzdan(?:im|imi|imda)?|balance)"
+)
+WALLET_BALANCE_FILLER_WORDS = frozenset(_fold_tr(w) for w in (
+    "ne", "kadar", "kaç", "var", "mi", "nedir", "benim", "göster", "söyle", "sorgula", "öğren", "kaldı", "my", "what", "is",
+))
+WALLET_BALANCE_MAX_WORDS = 5
+WALLET_BALANCE_WORD_RE = re.compile(r"\w+")
+# Any wallet-related wording forces wallet_query ahead of the Router Agent
+WALLET_INTENT_RE = _compile_keyword_pattern((
+    "bakiye", "kredi", "param", "cüzdan", "balance", "işlemlerim", "harcamalarım", "geçmiş",
+))
+# Follow-ups that refer back to the last search results ("2 nolu ilanı göster", "3'ü sil")
+LAST_SEARCH_CONTEXT_RE = _compile_keyword_pattern((
+    "nolu", "numar", "detay", "göster", "foto", "kategori", "güncelle", "sil",
+))
+DETAIL_VIEW_RE = _compile_keyword_pattern(("detay", "göster", "foto"))
+UPDATE_LIKE_RE = _compile_keyword_pattern(("güncelle", "düzenle", "değiş", "sil"))
+
+
+def _format_wallet_amount(value: Any) -> str:
+    try:
+        return f"{float(value):.2f}".rstrip("0").rstrip(".")
+    except (TypeError, ValueError):
+        return "0"
+
+
+def _is_plain_balance_query(text: str) -> bool:
+    """True only for short, whole-word balance questions; anything with other content goes to routing."""
+    words = WALLET_BALANCE_WORD_RE.findall(_fold_tr(text))
+    if not words or len(words) > WALLET_BALANCE_MAX_WORDS:
+        return False
+    has_balance_word = False
+    for word in words:
+        if WALLET_BALANCE_QUERY_RE.fullmatch(word):
+            has_balance_word = True
+        elif word not in WALLET_BALANCE_FILLER_WORDS:
+            return False
+    folded = " ".join(words)
+    return has_balance_word and not any(
+        FAST_ROUTE_RES[intent].search(folded) for intent in ("create_listing", "search_product")
+    )
+
+
+async def _plain_balance_reply(user_id: str) -> Optional[str]:
+    """Fixed balance sentence, or None when the wallet lookup fails (callers fall back to PublishAgent)."""
+    balance = await asyncio.to_thread(get_wallet_balance, user_id)
+    if not balance.get("success"):
+        return None
+    return (
+        f"💰 Bakiyeniz: {_format_wallet_amount(balance.get('balance_credits'))} kredi "
+        f"(₺{_format_wallet_amount(balance.get('balance_try'))})"
+    )
 
 
 def _extract_listing_detail_request(text: str) -> Optional[int]:
@@ -275,14 +504,14 @@ def _extract_listing_detail_request(text: str) -> Optional[int]:
     number = _extract_listing_number(text)
     if number is None:
         return None
-    lowered = text.lower()
-    if any(token in lowered for token in DETAIL_COMMAND_HINTS) or "ilan" in lowered:
+    lowered = _fold_tr(text)
+    if "ilan" in lowered or DETAIL_COMMAND_RE.search(lowered):
         return number
     return None
 
 
-def _hydrate_cached_results(user_key: str) -> List[Dict[str, Any]]:
-    cached = USER_LAST_SEARCH_RESULTS_STORE.get(user_key) or []
+async def _hydrate_cached_results(user_key: str) -> List[Dict[str, Any]]:
+    cached = await USER_LAST_SEARCH_RESULTS_STORE.get(user_key) or []
     if cached:
         return cached
     session = _get_search_session(user_key)
@@ -292,7 +521,7 @@ def _hydrate_cached_results(user_key: str) -> List[Dict[str, Any]]:
             payload = search_composer_agent.build_cache_payload(
                 listings[: search_composer_agent.fetch_limit]
             )
-            USER_LAST_SEARCH_RESULTS_STORE[user_key] = payload
+            await USER_LAST_SEARCH_RESULTS_STORE.set(user_key, payload)
             return payload
     return []
 
@@ -302,28 +531,21 @@ def _format_listing_detail_message(index: int, listing: Dict[str, Any]) -> str:
     price_text = SearchComposerAgent._format_price(listing.get("price"))  # type: ignore[attr-defined]
     location = listing.get("location") or "Konum belirtilmemiş"
     category = listing.get("category") or "Kategori yok"
-    owner_bits: List[str] = []
-    if listing.get("user_name"):
-        owner_bits.append(str(listing.get("user_name")))
-    if listing.get("user_phone"):
-        owner_bits.append(str(listing.get("user_phone")))
-    owner_line = f"👤 {' | '.join(owner_bits)}" if owner_bits else "👤 Satıcı bilgisi mevcut değil"
+    owner = " | ".join(str(v) for v in (listing.get("user_name"), listing.get("user_phone")) if v)
+    owner_line = f"👤 {owner}" if owner else "👤 Satıcı bilgisi mevcut değil"
     description = (listing.get("description") or "").strip()
-    lines = [
-        f"{index}️⃣ {title}",
-        f"💰 {price_text} | 📍 {location} | 🏷️ {category}",
-        owner_line,
-    ]
-    if description:
-        lines.append("")
-        lines.append(f"Açıklama: {description}")
-    lines.append("")
-    lines.append("Bu ilanda işlem yapmak için 'bu ilanı sil' veya 'güncelle' diyebilirsin.")
-    return "\n".join(lines)
+    description_block = f"\n\nAçıklama: {description}" if description else ""
+    return (
+        f"{index}️⃣ {title}\n"
+        f"💰 {price_text} | 📍 {location} | 🏷️ {category}\n"
+        f"{owner_line}"
+        f"{description_block}\n\n"
+        "Bu ilanda işlem yapmak için 'bu ilanı sil' veya 'güncelle' diyebilirsin."
+    )
 
 
 async def _build_listing_detail_response(user_key: str, listing_index: int) -> Dict[str, Any]:
-    cached = _hydrate_cached_results(user_key)
+    cached = await _hydrate_cached_results(user_key)
     if not cached:
         return {
             "response": "Önce bir arama sonucu görelim. Hangi ürünü arıyorsun?",
@@ -339,10 +561,7 @@ async def _build_listing_detail_response(user_key: str, listing_index: int) -> D
     listing = cached[listing_index - 1]
     listing_id = listing.get("id")
     if listing_id and _is_uuid(str(listing_id)):
-        USER_ACTIVE_LISTING_STORE[user_key] = str(listing_id)
-        state = resolve_conversation_state()
-        if isinstance(state, dict):
-            state["active_listing_id"] = str(listing_id)
+        await _set_active_listing(user_key, str(listing_id), resolve_conversation_state())
     message = _format_listing_detail_message(listing_index, listing)
     return {
         "response": message,
@@ -363,7 +582,7 @@ async def _execute_new_search(user_key: str, query_text: str) -> Dict[str, Any]:
             "cursor": len(composer_result.get("listings", [])),
         }
         _store_search_session(user_key, session_payload)
-        USER_LAST_SEARCH_RESULTS_STORE[user_key] = composer_result.get("cache_payload") or []
+        await USER_LAST_SEARCH_RESULTS_STORE.set(user_key, composer_result.get("cache_payload") or [])
     else:
         _clear_search_session(user_key)
     return composer_result
@@ -387,7 +606,7 @@ async def _fetch_additional_results(user_key: str, session: Dict[str, Any]) -> b
     session["listings"] = composer_result.get("listings_full") or []
     session["total"] = composer_result.get("total", total)
     session["category"] = composer_result.get("category") or session.get("category")
-    USER_LAST_SEARCH_RESULTS_STORE[user_key] = composer_result.get("cache_payload") or []
+    await USER_LAST_SEARCH_RESULTS_STORE.set(user_key, composer_result.get("cache_payload") or [])
     _store_search_session(user_key, session)
     return True
 
@@ -417,7 +636,7 @@ async def _build_show_more_response(user_key: str, session: Dict[str, Any]) -> D
     cache_payload = search_composer_agent.build_cache_payload(
         listings[: search_composer_agent.fetch_limit]
     )
-    USER_LAST_SEARCH_RESULTS_STORE[user_key] = cache_payload
+    await USER_LAST_SEARCH_RESULTS_STORE.set(user_key, cache_payload)
 
     message = search_composer_agent.format_preview_chunk(
         chunk,
@@ -658,9 +877,10 @@ async def insert_listing_tool(
         images: Supabase storage path list
         listing_id: Opsiyonel, önceden belirlenmiş UUID (mediayla senkron)
     """
-    resolved_user_id = resolve_user_id(user_id)
-    resolved_user_name = resolve_user_name()
-    resolved_user_phone = resolve_user_phone()
+    resolved = resolve_all()
+    resolved_user_id = user_id or resolved.user_id
+    resolved_user_name = resolved.user_name
+    resolved_user_phone = resolved.user_phone
     
     return await insert_listing(
         title=title,
@@ -679,6 +899,33 @@ async def insert_listing_tool(
     )
 
 
+def _compact_search_results(rows: List[Any], limit: int = 25) -> List[Dict[str, Any]]:
+    """Reduce raw search rows to the compact shape cached in USER_LAST_SEARCH_RESULTS_STORE."""
+    compact: List[Dict[str, Any]] = []
+    for item in rows:
+        if not isinstance(item, dict):
+            continue
+        listing_id = item.get("id")
+        if not listing_id:
+            continue
+        signed = item.get("signed_images")
+        compact.append({
+            "id": listing_id,
+            "title": item.get("title"),
+            "price": item.get("price"),
+            "category": item.get("category"),
+            "location": item.get("location"),
+            "condition": item.get("condition"),
+            "user_name": item.get("user_name") or item.get("owner_name"),
+            "user_phone": item.get("user_phone") or item.get("owner_phone"),
+            "signed_images": signed[:3] if isinstance(signed, list) else [],
+        })
+        # Only the first `limit` are kept; stop instead of compacting rows that get sliced off
+        if len(compact) >= limit:
+            break
+    return compact
+
+
 @function_tool
 async def search_listings_tool(
     query: Optional[str] = None,
@@ -724,31 +971,33 @@ async def search_listings_tool(
     try:
         user_key = resolve_user_id() or "anonymous"
         if isinstance(result, dict) and result.get("success") and isinstance(result.get("results"), list):
-            compact: List[Dict[str, Any]] = []
-            for item in cast(List[Any], result.get("results") or []):
-                if not isinstance(item, dict):
-                    continue
-                listing_id = item.get("id")
-                if not listing_id:
-                    continue
-                compact.append({
-                    "id": listing_id,
-                    "title": item.get("title"),
-                    "price": item.get("price"),
-                    "category": item.get("category"),
-                    "location": item.get("location"),
-                    "condition": item.get("condition"),
-                    "user_name": item.get("user_name") or item.get("owner_name"),
-                    "user_phone": item.get("user_phone") or item.get("owner_phone"),
-                    "signed_images": (item.get("signed_images") or [])[:3] if isinstance(item.get("signed_images"), list) else [],
-                })
-            USER_LAST_SEARCH_RESULTS_STORE[user_key] = compact[:25]
+            await USER_LAST_SEARCH_RESULTS_STORE.set(user_key, _compact_search_results(cast(List[Any], result["results"])))
     except Exception:
         pass
 
     return result
 
 
+async def _listing_id_candidates(raw: str, user_key: str, conv_state: Dict[str, Any]) -> AsyncIterator[Optional[str]]:
+    """Yield listing_id candidates in priority order; callers stop at the first valid UUID.
+
+    Order: raw value → UUID embedded in text → "1 nolu ilan" mapped via last search results
+    → active listing in conversation_state → active listing store.
+    """
+    yield raw
+    yield _extract_uuid(raw)
+    num = _extract_listing_number(raw)
+    if num is not None:
+        last = await _get_last_results_for_user(user_key)
+        if 0 < num <= len(last):
+            mapped_id = last[num - 1].get("id")
+            yield str(mapped_id) if mapped_id else None
+    active = conv_state.get("active_listing_id") if isinstance(conv_state, dict) else None
+    yield str(active) if active else None
+    active_store = await USER_ACTIVE_LISTING_STORE.get(user_key)
+    yield str(active_store) if active_store else None
+
+
 @function_tool(strict_mode=False)
 async def update_listing_tool(
     listing_id: str,
@@ -770,45 +1019,25 @@ async def update_listing_tool(
         title, price, condition, category, description, location, stock, metadata: Güncellenecek alanlar
         images: Güncel fotoğraf path listesi (tam liste gönderilir)
     """
-    resolved_user_id = resolve_user_id()
+    resolved = resolve_all()
+    resolved_user_id = resolved.user_id
     if not resolved_user_id:
         return {
             "success": False,
             "error": "not_authenticated",
             "message": "User not authenticated",
         }
+    conv_state = resolved.conversation_state
 
     # Normalize/resolve listing_id (agents sometimes pass "#1" or embed UUID in text)
     original_listing_id = listing_id
-    listing_id_candidate = str(listing_id or "").strip()
-    if not _is_uuid(listing_id_candidate):
-        extracted = _extract_uuid(listing_id_candidate)
-        if extracted and _is_uuid(extracted):
-            listing_id_candidate = extracted
-
-    if not _is_uuid(listing_id_candidate):
-        # Try mapping from last search results: "1 nolu ilan" → stored result id
-        num = _extract_listing_number(listing_id_candidate)
-        if num is not None:
-            last = USER_LAST_SEARCH_RESULTS_STORE.get(resolved_user_id) or []
-            idx = num - 1
-            if 0 <= idx < len(last):
-                mapped_id = last[idx].get("id")
-                if mapped_id and _is_uuid(str(mapped_id)):
-                    listing_id_candidate = str(mapped_id)
-
-    if not _is_uuid(listing_id_candidate):
-        # Fall back to active listing in conversation_state/store
-        state = resolve_conversation_state()
-        active = state.get("active_listing_id") if isinstance(state, dict) else None
-        if active and _is_uuid(str(active)):
-            listing_id_candidate = str(active)
-        else:
-            active_store = USER_ACTIVE_LISTING_STORE.get(resolved_user_id)
-            if active_store and _is_uuid(str(active_store)):
-                listing_id_candidate = str(active_store)
+    listing_id_candidate = ""
+    async for candidate in _listing_id_candidates(str(listing_id or "").strip(), resolved_user_id, conv_state):
+        if _is_uuid(candidate):
+            listing_id_candidate = cast(str, candidate)
+            break
 
-    if not _is_uuid(listing_id_candidate):
+    if not listing_id_candidate:
         return {
             "success": False,
             "error": "invalid_listing_id",
@@ -816,10 +1045,7 @@ async def update_listing_tool(
         }
 
     # Persist active listing for subsequent photo/category updates
-    USER_ACTIVE_LISTING_STORE[resolved_user_id] = listing_id_candidate
-    state_for_update = resolve_conversation_state()
-    if isinstance(state_for_update, dict):
-        state_for_update["active_listing_id"] = listing_id_candidate
+    await _set_active_listing(resolved_user_id, listing_id_candidate, conv_state)
 
     return await update_listing(
         listing_id=listing_id_candidate,
@@ -909,9 +1135,28 @@ async def market_price_tool(
     )
 
 
-# Shared client for guardrails
-client = AsyncOpenAI()
-ctx = SimpleNamespace(guardrail_llm=client)
+# Shared client for guardrails: built on first guardrail call with a pool sized for the
+# concurrent per-guardrail / per-batch checks (the default keeps only 20 connections alive)
+GUARDRAIL_POOL_LIMITS = httpx.Limits(max_connections=256, max_keepalive_connections=128)
+
+
+@dataclass(frozen=True, slots=True)
+class GuardrailContext:
+    """Context object run_guardrails reads the LLM client from"""
+    guardrail_llm: AsyncOpenAI
+
+
+@lru_cache(maxsize=1)
+def get_guardrail_ctx() -> GuardrailContext:
+    http_client = httpx.AsyncClient(limits=GUARDRAIL_POOL_LIMITS, timeout=httpx.Timeout(30.0, connect=5.0))
+    return GuardrailContext(guardrail_llm=AsyncOpenAI(http_client=http_client))
+
+
+async def close_guardrail_client() -> None:
+    """Close the guardrail client if one was created (called from the FastAPI shutdown hook)."""
+    if get_guardrail_ctx.cache_info().currsize:
+        await get_guardrail_ctx().guardrail_llm.close()
+        get_guardrail_ctx.cache_clear()
 
 
 # Guardrails configuration
@@ -924,83 +1169,269 @@ guardrails_sanitize_input_config: Dict[str, List[Dict[str, Any]]] = {
 }
 
 
+@lru_cache(maxsize=16)
+def _instantiate_guardrails_from_json(config_json: str) -> Any:
+    return instantiate_guardrails(cast(Any, load_config_bundle(cast(Any, json.loads(config_json)))))
+
+
+# {id(obj): (obj, canonical JSON)}; guardrail configs are long-lived module constants, so each is serialized once
+_GUARDRAIL_JSON_CACHE: Dict[int, Tuple[Any, str]] = {}
+
+
+def _guardrail_json(obj: Any) -> str:
+    cached = _GUARDRAIL_JSON_CACHE.get(id(obj))
+    if cached is not None and cached[0] is obj:
+        return cached[1]
+    encoded = json.dumps(obj, sort_keys=True, default=str)
+    _GUARDRAIL_JSON_CACHE[id(obj)] = (obj, encoded)
+    return encoded
+
+
+# {id(entry): (entry, instantiated one-entry bundle)}; entries belong to module-level configs, so the
+# per-turn lookup is a single dict hit instead of JSON concatenation + lru_cache hashing
+_GUARDRAIL_BUNDLE_CACHE: Dict[int, Tuple[Dict[str, Any], Any]] = {}
+
+
+def get_instantiated_guardrail(guardrail: Dict[str, Any]) -> Any:
+    """Bundle holding just one guardrail entry; shares the cache slot of the equivalent one-entry config."""
+    cached = _GUARDRAIL_BUNDLE_CACHE.get(id(guardrail))
+    if cached is not None and cached[0] is guardrail:
+        return cached[1]
+    bundle = _instantiate_guardrails_from_json('{"guardrails": [' + _guardrail_json(guardrail) + "]}")
+    _GUARDRAIL_BUNDLE_CACHE[id(guardrail)] = (guardrail, bundle)
+    return bundle
+
+
+def warm_guardrail_bundles() -> None:
+    """Parse + instantiate the sanitize-input bundles up front (called at app startup) so the first turn doesn't pay for it."""
+    for g in guardrails_sanitize_input_config["guardrails"]:
+        get_instantiated_guardrail(g)
+
+
+# {id(config): (config, {guardrail name: guardrail entry})}; configs are long-lived module constants
+_GUARDRAIL_INDEX_CACHE: Dict[int, Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]] = {}
+
+
+# Shared read-only fallbacks for "(x or {}).get(...) or []" lookups so hot paths don't allocate throwaway containers
+_EMPTY_MAPPING: Mapping[str, Any] = MappingProxyType({})
+_EMPTY_SEQ: Tuple[Any, ...] = ()
+
+
+def _index_guardrails(config: Optional[Dict[str, Any]]) -> Mapping[str, Dict[str, Any]]:
+    """Guardrail entries by name (first entry wins), built once per config object."""
+    if not config:
+        return _EMPTY_MAPPING
+    cached = _GUARDRAIL_INDEX_CACHE.get(id(config))
+    if cached is not None and cached[0] is config:
+        return cached[1]
+    index: Dict[str, Dict[str, Any]] = {}
+    for g in config.get("guardrails") or _EMPTY_SEQ:
+        if g and g.get("name"):
+            index.setdefault(g["name"], g)
+    _GUARDRAIL_INDEX_CACHE[id(config)] = (config, index)
+    return index
+
+
 def guardrails_has_tripwire(results: Optional[Iterable[Any]]) -> bool:
-    return any((hasattr(r, "tripwire_triggered") and (getattr(r, "tripwire_triggered") is True)) for r in (results or []))
+    for r in (results or ()):
+        if getattr(r, "tripwire_triggered", False) is True:
+            return True
+    return False
 
 
 def get_guardrail_safe_text(results: Optional[Iterable[Any]], fallback_text: str) -> str:
-    for r in (results or []):
-        info: Any = (r.info if hasattr(r, "info") else None) or {}
-        if isinstance(info, dict) and ("checked_text" in info):
-            return str(info.get("checked_text") or fallback_text)
-    pii = next(
-        (
-            (r.info if hasattr(r, "info") else {})
-            for r in (results or [])
-            if isinstance((r.info if hasattr(r, "info") else None) or {}, dict)
-            and ("anonymized_text" in ((r.info if hasattr(r, "info") else None) or {}))
-        ),
-        None,
-    )
-    if isinstance(pii, dict) and ("anonymized_text" in pii):
-        return str(pii.get("anonymized_text") or fallback_text)
+    # Single pass: checked_text wins outright, otherwise the first anonymized_text seen
+    anonymized: Optional[Dict[str, Any]] = None
+    for r in (results or ()):
+        info = getattr(r, "info", None)
+        if not isinstance(info, dict):
+            continue
+        if "checked_text" in info:
+            return str(info["checked_text"] or fallback_text)
+        if anonymized is None and "anonymized_text" in info:
+            anonymized = info
+    if anonymized is not None:
+        return str(anonymized["anonymized_text"] or fallback_text)
     return fallback_text
 
 
+# Guardrail LLM errors worth retrying; anything else propagates to the caller on the first attempt
+TRANSIENT_GUARDRAIL_ERRORS = (RateLimitError, APIConnectionError, asyncio.TimeoutError)
+GUARDRAIL_CALL_ATTEMPTS = 3
+# Process-wide cap on in-flight guardrail LLM calls (checks + PII scrubs across all turns), sized to the
+# guardrail client's keep-alive pool so bursts queue here instead of opening throwaway connections
+GUARDRAIL_CONCURRENCY = asyncio.Semaphore(128)
+
+
+async def _run_guardrail_bundle(text: str, bundle: Any) -> List[Any]:
+    """run_guardrails under the shared concurrency cap, with exponential backoff + jitter on rate limits / connection drops."""
+    for attempt in range(GUARDRAIL_CALL_ATTEMPTS):
+        try:
+            async with GUARDRAIL_CONCURRENCY:
+                return await run_guardrails(get_guardrail_ctx(), text, "text/plain", bundle, suppress_tripwire=True, raise_guardrail_errors=True)
+        except TRANSIENT_GUARDRAIL_ERRORS:
+            if attempt == GUARDRAIL_CALL_ATTEMPTS - 1:
+                raise
+            await asyncio.sleep(random.uniform(0, min(4.0, 0.2 * 2 ** attempt)))
+    return []
+
+
+async def _scrub_pii_texts(texts: List[str], pii_guardrails: Any) -> List[str]:
+    """Scrub each text with its own guardrail call, concurrently; a failed call leaves that text unmasked."""
+    results = await asyncio.gather(
+        *(_run_guardrail_bundle(t, pii_guardrails) for t in texts),
+        return_exceptions=True,
+    )
+    scrubbed: List[str] = []
+    for t, res in zip(texts, results):
+        if isinstance(res, BaseException):
+            logger.warning("PII scrub failed; text left unmasked", exc_info=res)
+            scrubbed.append(t)
+        else:
+            scrubbed.append(get_guardrail_safe_text(res, t))
+    return scrubbed
+
+
 async def scrub_conversation_history(history: Optional[Iterable[Dict[str, Any]]], config: Optional[Dict[str, Any]]):
     try:
-        guardrails: List[Dict[str, Any]] = (config or {}).get("guardrails") or []
-        pii = next((g for g in guardrails if (g or {}).get("name") == "Contains PII"), None)
+        pii = _index_guardrails(config).get("Contains PII")
         if not pii:
             return
-        pii_only = {"guardrails": [pii]}
-        for msg in (history or []):
-            content = (msg or {}).get("content") or []
-            for part in content:
-                if isinstance(part, dict) and part.get("type") == "input_text" and isinstance(part.get("text"), str):
-                    pii_bundle: Any = load_config_bundle(cast(Any, pii_only))
-                    res = await run_guardrails(ctx, part["text"], "text/plain", instantiate_guardrails(pii_bundle), suppress_tripwire=True, raise_guardrail_errors=True)
-                    part["text"] = get_guardrail_safe_text(res, part["text"])
+        # Flatten the message tree once into parallel (part, text) arrays; write-back goes through the part refs
+        targets = [
+            (part, part["text"])
+            for msg in (history or _EMPTY_SEQ)
+            for part in ((msg or _EMPTY_MAPPING).get("content") or _EMPTY_SEQ)
+            if isinstance(part, dict) and part.get("type") == "input_text" and isinstance(part.get("text"), str)
+        ]
+        if not targets:
+            return
+        texts = [text for _, text in targets]
+        pii_guardrails = get_instantiated_guardrail(pii)
+        # Parts are independent, so scrub them concurrently (one round-trip of latency, not one per part)
+        scrubbed = await _scrub_pii_texts(texts, pii_guardrails)
+        for (part, original), new_text in zip(targets, scrubbed):
+            if new_text != original:
+                part["text"] = new_text
     except Exception:
-        pass
+        logger.exception("PII scrub failed; history left unmasked")
 
 
-async def scrub_workflow_input(workflow: Optional[Dict[str, Any]], input_key: str, config: Optional[Dict[str, Any]]):
+async def scrub_workflow_inputs(workflow: Optional[Dict[str, Any]], input_keys: Iterable[str], config: Optional[Dict[str, Any]]):
+    """PII-scrub several workflow text fields concurrently (identical values are scrubbed once)."""
     try:
-        guardrails: List[Dict[str, Any]] = (config or {}).get("guardrails") or []
-        pii = next((g for g in guardrails if (g or {}).get("name") == "Contains PII"), None)
+        pii = _index_guardrails(config).get("Contains PII")
         if not pii:
             return
         if not isinstance(workflow, dict):
             return
-        value = workflow.get(input_key)
-        if not isinstance(value, str):
+        keys = [k for k in input_keys if isinstance(workflow.get(k), str)]
+        if not keys:
             return
-        pii_only = {"guardrails": [pii]}
-        pii_bundle: Any = load_config_bundle(cast(Any, pii_only))
-        res = await run_guardrails(ctx, value, "text/plain", instantiate_guardrails(pii_bundle), suppress_tripwire=True, raise_guardrail_errors=True)
-        workflow[input_key] = get_guardrail_safe_text(res, value)
+        unique_values = list(dict.fromkeys(workflow[k] for k in keys))
+        scrubbed = await _scrub_pii_texts(unique_values, get_instantiated_guardrail(pii))
+        safe_by_value = dict(zip(unique_values, scrubbed))
+        for k in keys:
+            workflow[k] = safe_by_value[workflow[k]]
     except Exception:
-        pass
+        logger.exception("PII scrub failed; workflow inputs left unmasked")
+
+
+async def run_guardrails_concurrently(input_text: str, guardrails: Sequence[Dict[str, Any]]) -> List[Any]:
+    """Run each guardrail as its own task so latency is the slowest check, not the sum.
+
+    Stops waiting (and cancels the rest) as soon as one result trips; results keep config order.
+    """
+    tasks = [asyncio.ensure_future(_run_guardrail_bundle(input_text, get_instantiated_guardrail(g))) for g in guardrails]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            if guardrails_has_tripwire(await next_done):
+                break
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    return [r for task in tasks if task.done() and not task.cancelled() and task.exception() is None for r in (task.result() or _EMPTY_SEQ)]
+
+
+# Verdicts for repeated inputs (retries, scripted buttons, duplicate transcriptions)
+# Format: {blake2b(text) + blake2b(config): (has_tripwire, safe_text)}
+GUARDRAIL_VERDICT_CACHE: LRUStore[bytes, Tuple[bool, str]] = LRUStore(maxsize=2048, ttl_seconds=600)
+
+
+def _guardrail_cache_key(input_text: str, config: Optional[Dict[str, Any]]) -> bytes:
+    config_json = _guardrail_json(config) if config else "{}"
+    return (
+        hashlib.blake2b(input_text.encode("utf-8"), digest_size=16).digest()
+        + hashlib.blake2b(config_json.encode("utf-8"), digest_size=16).digest()
+    )
 
 
 async def run_and_apply_guardrails(input_text: str, config: Optional[Dict[str, Any]], history: Optional[Iterable[Any]], workflow: Optional[Dict[str, Any]]):
-    config_bundle: Any = load_config_bundle(cast(Any, config))
-    results = await run_guardrails(ctx, input_text, "text/plain", instantiate_guardrails(config_bundle), suppress_tripwire=True, raise_guardrail_errors=True)
-    guardrails: List[Dict[str, Any]] = (config or {}).get("guardrails") or []
-    mask_pii = next((g for g in guardrails if (g or {}).get("name") == "Contains PII" and ((g or {}).get("config") or {}).get("block") is False), None) is not None
+    guardrails: Sequence[Dict[str, Any]] = (config or _EMPTY_MAPPING).get("guardrails") or _EMPTY_SEQ
+    pii = _index_guardrails(config).get("Contains PII")
+    mask_pii = pii is not None and (pii.get("config") or _EMPTY_MAPPING).get("block") is False
+    # PII masking rewrites history/workflow in place, so only the pure-verdict path is cacheable
+    cache_key = None if mask_pii else _guardrail_cache_key(input_text, config)
+    cached = GUARDRAIL_VERDICT_CACHE.get(cache_key) if cache_key else None
+    if cached is not None:
+        return {"results": [], "has_tripwire": cached[0], "safe_text": cached[1]}
+
     if mask_pii:
-        await scrub_conversation_history(history, config)
-        await scrub_workflow_input(workflow, "input_as_text", config)
-        await scrub_workflow_input(workflow, "input_text", config)
+        # Checks, history scrub and input scrub touch disjoint data, so all three round-trips overlap
+        # (the scrub helpers log and swallow their own errors)
+        results, _, _ = await asyncio.gather(
+            run_guardrails_concurrently(input_text, guardrails),
+            scrub_conversation_history(history, config),
+            scrub_workflow_inputs(workflow, ("input_as_text", "input_text"), config),
+        )
+    else:
+        results = await run_guardrails_concurrently(input_text, guardrails)
     has_tripwire = guardrails_has_tripwire(results)
     safe_text = get_guardrail_safe_text(results, input_text)
+    if cache_key:
+        GUARDRAIL_VERDICT_CACHE[cache_key] = (has_tripwire, safe_text)
     return {"results": results, "has_tripwire": has_tripwire, "safe_text": safe_text}
 
 
 # Intent classifier output schema
+# Intents the Router Agent may return; as a Literal they become an enum in the structured-output schema,
+# so the model can't emit a misspelled intent that would fall through to "Unknown intent"
+RouterIntent = Literal[
+    "create_listing",
+    "update_listing",
+    "delete_listing",
+    "publish_listing",
+    "search_product",
+    "wallet_query",
+    "small_talk",
+    "cancel",
+]
+
+
 class RouterAgentIntentClassifierSchema(BaseModel):
-    intent: str
+    intent: RouterIntent
+
+
+# Shared TTS block; agents that reuse it get a byte-identical instructions tail
+TTS_RULES = """🎙️ TURKISH TTS OPTIMIZATION (for all text responses):
+- Use commas for natural pauses: "Merhaba! Nasıl yardımcı olabilirim?"
+- Always end questions with '?': "Ne arıyorsunuz?"
+- End statements with '.': "İlan başarıyla oluşturuldu."
+- Separate list items with commas: "İlan ver, ürün ara, yardım al"
+- Keep sentences short (max 15 words) for better voice clarity
+"""
+
+# Shared by the owner-only agents (update/delete); same byte-identical-block approach as TTS_RULES
+OWNER_ACTION_STYLE_RULES = """✅ IMPORTANT STYLE (VERY SHORT):
+- If user is not authenticated OR ownership cannot be verified, respond in 1–2 short sentences.
+- No bullet lists, no long explanations.
+- At most ONE question.
+"""
+
+# Every conversational agent runs with the same settings (responses stored, no reasoning block);
+# ModelSettings is only read by the SDK, so one instance is shared
+STORED_MODEL_SETTINGS = ModelSettings(store=True)
 
 
 # Agent definitions with all instructions from Agent Builder
@@ -1080,18 +1511,10 @@ Respond ONLY with valid JSON following the schema.
 
 Respond with JSON only: {"intent": "create_listing"}
 
-🎙️ TURKISH TTS OPTIMIZATION (for all text responses):
-- Use commas for natural pauses: "Merhaba! Nasıl yardımcı olabilirim?"
-- Always end questions with '?': "Ne arıyorsunuz?"
-- End statements with '.': "İlan başarıyla oluşturuldu."
-- Separate list items with commas: "İlan ver, ürün ara, yardım al"
-- Keep sentences short (max 15 words) for better voice clarity
-""",
+""" + TTS_RULES,
     model="gpt-4o",
     output_type=RouterAgentIntentClassifierSchema,
-    model_settings=ModelSettings(
-        store=True
-    )
+    model_settings=STORED_MODEL_SETTINGS
 )
 
 
@@ -1164,6 +1587,26 @@ Rules: Never generate images. Never speculate model beyond what is visible. When
 )
 
 
+class VisionSafetyBatchItemSchema(VisionSafetyProductSchema):
+    index: int
+
+
+class VisionSafetyBatchSchema(BaseModel):
+    results: List[VisionSafetyBatchItemSchema]
+
+
+# Same rules as the single-image agent, but one call covers every uploaded photo
+vision_safety_batch_agent = vision_safety_product_agent.clone(
+        name="VisionSafetyBatchAgent",
+        instructions=cast(str, vision_safety_product_agent.instructions) + """
+BATCH MODE: You receive several images in one message, in order (index 0 = first image).
+Apply every rule above to EACH image independently; one image being unsafe must not affect the others.
+Return STRICT JSON: {"results": [{"index": 0, ...same fields as above...}, {"index": 1, ...}]} with exactly one entry per image.
+""",
+        output_type=AgentOutputSchema(VisionSafetyBatchSchema, strict_json_schema=False),
+)
+
+
 listingagent = Agent(
     name="ListingAgent",
     instructions="""You are CreateListingAgent of PazarGlobal.
@@ -1274,6 +1717,8 @@ Show complete draft:
 6. User uploads photo → Auto-detect, add to draft: "✅ Fotoğraf eklendi! (Toplam: [N])"
 
 ⚠️ **DON'T route to UpdateListingAgent - handle edits yourself and show updated preview!**
+- If a [PARSED_DRAFT] {...} note exists, it already holds the current preview's fields (title, price, category,
+  condition, location, description, images, metadata). Apply the user's edit to those values instead of re-reading the preview.
 
 ## 🔧 AUTO-EXTRACT (Internal - Don't ask user):
 - **stock** → Default 1
@@ -1307,9 +1752,7 @@ Show batch question again: "**[Field1] – [Field2] – [Field3]**\nÖrnek: ..."
 Store prepared listing in context for PublishAgent.""",
     model="gpt-4o",
     tools=[clean_price_tool],
-    model_settings=ModelSettings(
-        store=True
-    )
+    model_settings=STORED_MODEL_SETTINGS
 )
 
 
@@ -1323,6 +1766,8 @@ publishagent = Agent(
 "onayla", "yayınla", "tamam", "evet", "onaylıyorum"
 
 📋 Flow:
+0. If a [PARSED_DRAFT] {...} note exists, it already holds the extracted preview fields (title, price, category,
+   location, condition, description, metadata, images, listing_id). Use it directly, fill only missing fields from step 2.
 1. **CRITICAL**: Search conversation history for "📝 İlan önizlemesi" message
    - IMPORTANT: Conversation messages are in format: {"role": "assistant", "content": [{"type": "output_text", "text": "..."}]}
    - You need to search in the "text" field inside output_text content
@@ -1428,9 +1873,7 @@ If user asks "işlemlerim", "harcamalarım", "geçmiş":
 """,
     model="gpt-4o-mini",
     tools=[insert_listing_tool, calculate_listing_cost_tool, deduct_listing_credits_tool, get_wallet_balance_tool, get_transaction_history_tool],
-    model_settings=ModelSettings(
-        store=True
-    )
+    model_settings=STORED_MODEL_SETTINGS
 )
 
 
@@ -1910,9 +2353,7 @@ When user asks for price estimate: "bu ürünün fiyatı ne olmalı", "fiyat ön
 - Use similarity_threshold=0.5 for market_price_tool""",
     model="gpt-4o-mini",
     tools=[search_listings_tool, market_price_tool],
-    model_settings=ModelSettings(
-        store=True
-    )
+    model_settings=STORED_MODEL_SETTINGS
 )
 
 
@@ -1922,11 +2363,7 @@ updatelistingagent = Agent(
 
 **PRIMARY TASK:** Manage user's existing listings - LIST, UPDATE, ADD PREMIUM, RENEW
 
-✅ IMPORTANT STYLE (VERY SHORT):
-- If user is not authenticated OR ownership cannot be verified, respond in 1–2 short sentences.
-- No bullet lists, no long explanations.
-- At most ONE question.
-
+""" + OWNER_ACTION_STYLE_RULES + """
 🔍 **MODE 1: LIST MY LISTINGS** (Primary task!)
 User says: "ilanlarımı göster", "ilanlarım", "bana ait ilanlar", "bu ürünler bana ait", "kime ait", "benim ilanlar"
 → IMMEDIATELY call list_user_listings_tool(user_id)
@@ -2024,9 +2461,7 @@ Tools available:
 NEVER use insert_listing_tool!""",
     model="gpt-4o",
     tools=[update_listing_tool, list_user_listings_tool, clean_price_tool, add_premium_badge_tool, renew_listing_tool, get_wallet_balance_tool],
-    model_settings=ModelSettings(
-        store=True
-    )
+    model_settings=STORED_MODEL_SETTINGS
 )
 
 
@@ -2060,12 +2495,7 @@ smalltalkagent = Agent(
 - If user just wants to "bakıp çıkıcam" or "sohbet/muhabbet" → allow it, but softly offer an action option.
 - Avoid emojis unless the user uses them first.
 
-🎙️ TURKISH TTS VOICE OPTIMIZATION:
-- Use commas for natural pauses.
-- Always end questions with '?'.
-- End statements with '.'.
-- Keep sentences short (max ~15 words).
-
+""" + TTS_RULES + """
 ## MODES
 
 ### MODE 1: GREETING
@@ -2110,35 +2540,7 @@ Reply pattern:
 
 🚫 No tools needed.""",
     model="gpt-4o-mini",
-    model_settings=ModelSettings(
-        store=True
-    )
-)
-
-
-cancelagent = Agent(
-    name="CancelAgent",
-    instructions="""You are CancelAgent of PazarGlobal.
-
-🎯 Task: Cancel operations and reset context.
-
-✅ Response (with proper punctuation for TTS):
-"🔄 İşlem iptal edildi.
-
-Yeni bir işlem için:
-• Ürün satmak: Ürün bilgilerini yazın.
-• Ürün aramak: Ne aradığınızı söyleyin."
-
-🎙️ TTS OPTIMIZATION:
-- Use periods at end of each instruction
-- Commas for list separation
-- Keep tone friendly and clear
-
-🚫 No tools needed.""",
-    model="gpt-4.1-mini",
-    model_settings=ModelSettings(
-        store=True
-    )
+    model_settings=STORED_MODEL_SETTINGS
 )
 
 
@@ -2215,11 +2617,7 @@ deletelistingagent = Agent(
 
 Delete user's listings.
 
-✅ IMPORTANT STYLE (VERY SHORT):
-- If user is not authenticated OR ownership cannot be verified, respond in 1–2 short sentences.
-- No bullet lists, no long explanations.
-- At most ONE question.
-
+""" + OWNER_ACTION_STYLE_RULES + """
 🔢 HOW TO HANDLE "X NOLU İLAN":
 - ALWAYS call list_user_listings_tool first (order=created_at.desc, same as search).
 - Map the user’s request number (1-based) to that list: #1 = first item, #2 = second, etc.
@@ -2245,13 +2643,55 @@ Tools:
 - delete_listing_tool""",
     model="gpt-4o-mini",
     tools=[delete_listing_tool, list_user_listings_tool],
-    model_settings=ModelSettings(
-        store=True
-    )
+    model_settings=STORED_MODEL_SETTINGS
 )
 
 
+# Intent -> agent for every intent answered by one Runner.run
+# (search_product is served by the SearchComposer and cancel by CANCEL_RESPONSE, not an agent)
+INTENT_AGENTS: Mapping[str, Agent] = MappingProxyType({
+    "create_listing": listingagent,
+    "update_listing": updatelistingagent,
+    "publish_listing": publishagent,
+    "wallet_query": publishagent,  # wallet tools live on PublishAgent
+    "small_talk": smalltalkagent,
+    "delete_listing": deletelistingagent,
+})
+
+
+# Intents that act on an existing listing and need a PIN-authenticated owner
+PROTECTED_INTENTS = frozenset({"update_listing", "delete_listing"})
+
+# Run configs are identical on every call, so they are built once and shared
+WORKFLOW_RUN_CONFIG = RunConfig(trace_metadata={
+    "__trace_source__": "agent-builder",
+    "workflow_id": "wf_691884cc7e6081908974fe06852942af0249d08cf5054fdb"
+})
+VISION_RUN_CONFIG = RunConfig(trace_metadata={
+    "__trace_source__": "agent-builder",
+    "workflow_id": "vision_safety_product"
+})
+VISION_BATCH_RUN_CONFIG = RunConfig(trace_metadata={
+    "__trace_source__": "agent-builder",
+    "workflow_id": "vision_safety_product_batch"
+})
+
+# Process-wide cap on in-flight agent runs (router, routed agent, vision); guardrails have their own cap.
+# Bursts queue here instead of all holding history and open model streams at once.
+AGENT_RUN_CONCURRENCY = asyncio.Semaphore(int(os.getenv("AGENT_RUN_CONCURRENCY", "64")))
+
+
+async def _run_agent(agent: Agent, agent_input: Any, run_config: RunConfig) -> Any:
+    """Runner.run under AGENT_RUN_CONCURRENCY"""
+    async with AGENT_RUN_CONCURRENCY:
+        return await Runner.run(agent, input=agent_input, run_config=run_config)
+
+
 # Workflow input schema
+# TOKEN OPTIMIZATION: only the most recent messages go into agent input (vision + long threads can reach 100K tokens otherwise)
+HISTORY_WINDOW = 10
+
+
 class WorkflowInput(BaseModel):
     input_as_text: str
     conversation_history: List[Dict[str, Any]] = []  # Previous messages from WhatsApp Bridge
@@ -2265,18 +2705,30 @@ class WorkflowInput(BaseModel):
     conversation_state: Optional[Dict[str, Any]] = None  # {mode, active_listing_id, last_intent}
 
 
+# Per-user session stores below are shared through Redis when REDIS_URL is set (multi-worker deployments),
+# otherwise they fall back to bounded in-process LRU stores. Accessors are awaited (redis.asyncio) and fall back
+# to the in-process store on Redis errors. Values are replaced whole, never mutated in place.
+
 # Session store for safe media paths (persists across messages within a session)
 # Format: {user_id: [safe_path1, safe_path2, ...]}
-# TODO: Replace with Redis/DB for production; this is in-memory for now
-USER_SAFE_MEDIA_STORE: Dict[str, List[str]] = {}
+USER_SAFE_MEDIA_STORE: SessionStore = make_session_store("pg:safe_media", maxsize=10000, ttl_seconds=86400)
 
 # Session store for last search results (compact), so "1 nolu ilan" can be resolved even if history is pruned.
 # Format: {user_id: [{id,title,price,category,location}, ...]}
-USER_LAST_SEARCH_RESULTS_STORE: Dict[str, List[Dict[str, Any]]] = {}
+# Bounded (LRU + TTL) so long-running workers don't accumulate one entry per user forever.
+USER_LAST_SEARCH_RESULTS_STORE: SessionStore = make_session_store("pg:last_search", maxsize=5000, ttl_seconds=3600)
 
 # Session store for currently active listing (selected listing for update flows)
 # Format: {user_id: listing_id}
-USER_ACTIVE_LISTING_STORE: Dict[str, str] = {}
+USER_ACTIVE_LISTING_STORE: SessionStore = make_session_store("pg:active_listing", maxsize=10000, ttl_seconds=3600)
+
+# Vision safety/product verdicts per image content (same photo re-sent on retries, edits, "fotoğraf ekle", re-uploads)
+# Format: {"<prompt_version>:etag:<storage ETag>" or "<prompt_version>:url:<sha256 of URL>": VisionSafetyProductSchema dict}
+VISION_RESULT_CACHE: LRUStore[str, Dict[str, Any]] = LRUStore(maxsize=10000, ttl_seconds=7 * 86400)
+# Editing the vision instructions changes this prefix, so stale verdicts are never served after a prompt change
+VISION_PROMPT_VERSION = hashlib.sha256(
+    (cast(str, vision_safety_product_agent.instructions) + cast(str, vision_safety_batch_agent.instructions)).encode("utf-8")
+).hexdigest()[:12]
 
 # Session store for listing search pagination contexts
 USER_SEARCH_SESSION_STORE: Dict[str, Dict[str, Any]] = {}
@@ -2285,14 +2737,274 @@ SEARCH_SESSION_TTL_SECONDS = 300
 search_composer_agent = SearchComposerAgent(preview_limit=5, fetch_limit=30)
 
 
+LAST_SEARCH_NOTE_RE = re.compile(r"#\d+\s+id=([0-9a-fA-F-]{36})\s+title=([^|]+)")
+
+
+def _parse_last_search_results_from_history(raw_hist: Any) -> List[Dict[str, Any]]:
+    """Parse a compact [LAST_SEARCH_RESULTS] note from incoming history.
+
+    Expected format:
+      [LAST_SEARCH_RESULTS] #1 id=... title=... | #2 id=... title=...
+    """
+    out: List[Dict[str, Any]] = []
+    if not isinstance(raw_hist, list):
+        return out
+    # Scan from newest to oldest
+    for msg in reversed(raw_hist):
+        if not isinstance(msg, dict):
+            continue
+        if msg.get("role") != "assistant":
+            continue
+        text = msg.get("content")
+        if not isinstance(text, str):
+            continue
+        if "[LAST_SEARCH_RESULTS]" not in text:
+            continue
+        # Extract segments like #1 id=... title=...
+        segments = text.split("[LAST_SEARCH_RESULTS]", 1)[1]
+        for m in LAST_SEARCH_NOTE_RE.finditer(segments):
+            lid = m.group(1).strip()
+            title = m.group(2).strip()
+            if lid:
+                out.append({"id": lid, "title": title})
+        if out:
+            return out
+    return out
+
+
+# Draft preview parsing for PublishAgent: fields are pulled out in Python and handed over as
+# a [PARSED_DRAFT] note, so the model only validates them instead of re-parsing the preview
+DRAFT_FIELD_RES: Dict[str, "re.Pattern[str]"] = {
+    "title": re.compile(r"📝\s*(?:\*\*Başlık:\*\*|İlan önizlemesi:?)\s*(.+)"),
+    "price": re.compile(r"💰\s*(?:\*\*Fiyat:\*\*)?\s*([\d.,]+(?:\s*(?:bin|milyon))?)\s*TL", re.IGNORECASE),
+    "condition": re.compile(r"(?:📦|🎨)\s*\*{0,2}Durum:\*{0,2}\s*(.+)"),
+    "category": re.compile(r"🏷️?\s*(?:\*\*Kategori:\*\*)?\s*(.+)"),
+    "location": re.compile(r"📍\s*(?:\*\*Konum:\*\*)?\s*(.+)"),
+    "description": re.compile(r"📄\s*\*{0,2}Açıklama:\*{0,2}\s*(.+)"),
+}
+DRAFT_METADATA_RE = re.compile(r"🔧 Metadata:\s*(\{.*?\})", re.DOTALL)
+MEDIA_PATHS_RE = re.compile(r"MEDIA_PATHS=(\[[^\]]*\])")
+DRAFT_LISTING_ID_RE = re.compile(r"DRAFT_LISTING_ID=([0-9a-fA-F-]{36})")
+
+
+def _history_item_text(item: Any) -> str:
+    content = item.get("content") if isinstance(item, dict) else None
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(str(part.get("text") or "") for part in content if isinstance(part, dict))
+    return ""
+
+
+def _parse_draft_from_history(history: Iterable[Any]) -> Dict[str, Any]:
+    """Extract the most recent draft preview plus media/draft-id notes; {} when there is no preview."""
+    preview = ""
+    media_paths: Optional[List[str]] = None
+    draft_listing_id: Optional[str] = None
+    for item in reversed(list(history or ())):
+        text = _history_item_text(item)
+        if not text:
+            continue
+        if not preview and any(marker in text for marker in DRAFT_PREVIEW_MARKERS):
+            preview = text
+        if media_paths is None:
+            media_match = MEDIA_PATHS_RE.search(text)
+            if media_match:
+                try:
+                    parsed_paths = ast.literal_eval(media_match.group(1))
+                    media_paths = [str(p) for p in parsed_paths] if isinstance(parsed_paths, list) else None
+                except (ValueError, SyntaxError):
+                    pass
+        if draft_listing_id is None:
+            draft_match = DRAFT_LISTING_ID_RE.search(text)
+            if draft_match:
+                draft_listing_id = draft_match.group(1)
+        if preview and media_paths is not None and draft_listing_id is not None:
+            break
+    if not preview:
+        return {}
+
+    draft: Dict[str, Any] = {}
+    for field_name, pattern in DRAFT_FIELD_RES.items():
+        match = pattern.search(preview)
+        if match:
+            draft[field_name] = match.group(1).strip().strip("*").strip()
+    if "price" in draft:
+        draft["price"] = clean_price(draft["price"]).get("clean_price")
+    metadata_match = DRAFT_METADATA_RE.search(preview)
+    if metadata_match:
+        try:
+            draft["metadata"] = json.loads(metadata_match.group(1))
+        except ValueError:
+            pass
+    draft["images"] = media_paths
+    draft["listing_id"] = draft_listing_id
+    return {k: v for k, v in draft.items() if v is not None}
+
+
+async def _get_last_results_for_user(user_key: str, raw_hist: Any = None) -> List[Dict[str, Any]]:
+    """Last search results for a user: session store first, then the history note (if history given)."""
+    last = await USER_LAST_SEARCH_RESULTS_STORE.get(user_key)
+    if last:
+        return last
+    return _parse_last_search_results_from_history(raw_hist) if raw_hist is not None else []
+
+
+# The router only needs recent turns; older notes it reasons about are pinned individually.
+# [SYSTEM_MEDIA_NOTE] items also carry the [VISION_PRODUCT] line, so pinning the media note keeps both.
+CLASSIFIER_WINDOW = 8
+CLASSIFIER_PINNED_PREFIXES = (
+    "[USER_CONTEXT]", "[AUTH_CONTEXT]", "[LAST_SEARCH_RESULTS]", "[SYSTEM_MEDIA_NOTE]", "[CONVERSATION_STATE]",
+)
+
+
+def _select_classifier_context(history: List[TResponseInputItem], window: int = CLASSIFIER_WINDOW) -> List[TResponseInputItem]:
+    """Last `window` items plus, from before them, the latest user/auth/search/media/state note and draft/published marker"""
+    if len(history) <= window:
+        return history
+    cut = len(history) - window
+    latest: Dict[str, int] = {}
+    for idx in range(cut):
+        text = _history_item_text(history[idx])
+        for prefix in CLASSIFIER_PINNED_PREFIXES:
+            if text.startswith(prefix):
+                latest[prefix] = idx
+                break
+        else:
+            for marker in LISTING_CONTEXT_MARKERS:
+                if marker in text:
+                    latest["listing"] = idx
+                    break
+    return [history[idx] for idx in sorted(latest.values())] + history[cut:]
+
+
+CONVERSATION_STATE_NOTE_FIELDS = (("MODE", "mode"), ("ACTIVE_LISTING_ID", "active_listing_id"), ("LAST_INTENT", "last_intent"))
+
+
+def _state_note_parts(state: Any) -> List[str]:
+    """KEY=value parts for a [CONVERSATION_STATE] note; unset fields are left out"""
+    if not isinstance(state, dict):
+        return []
+    return [f"{label}={value}" for label, key in CONVERSATION_STATE_NOTE_FIELDS if (value := state.get(key))]
+
+
+def _media_note_text(draft_listing_id: Optional[str], media_paths: Optional[List[str]] = None) -> str:
+    """[SYSTEM_MEDIA_NOTE] line in the form ListingAgent/PublishAgent parse (DRAFT_LISTING_ID | MEDIA_PATHS)"""
+    if draft_listing_id and media_paths:
+        return f"[SYSTEM_MEDIA_NOTE] DRAFT_LISTING_ID={draft_listing_id} | MEDIA_PATHS={media_paths}"
+    if draft_listing_id:
+        return f"[SYSTEM_MEDIA_NOTE] DRAFT_LISTING_ID={draft_listing_id}"
+    return f"[SYSTEM_MEDIA_NOTE] MEDIA_PATHS={media_paths}"
+
+
+def _assistant_note(text: str) -> TResponseInputItem:
+    """Assistant-role history item (the SDK expects output_text for assistant content)"""
+    return cast(TResponseInputItem, {
+        "role": "assistant",
+        "content": [
+            {"type": "output_text", "text": text}
+        ]
+    })
+
+
+def _user_message(text: str) -> TResponseInputItem:
+    """User-role history item (input_text content)"""
+    return cast(TResponseInputItem, {
+        "role": "user",
+        "content": [
+            {"type": "input_text", "text": text}
+        ]
+    })
+
+
+# Bridge history role -> SDK input item builder
+HISTORY_ITEM_BUILDERS: Mapping[str, Callable[[str], TResponseInputItem]] = MappingProxyType({
+    "user": _user_message,
+    "assistant": _assistant_note,
+})
+
+
+async def _run_vision_single(image_url: str) -> Dict[str, Any]:
+    vision_input: List[TResponseInputItem] = cast(List[TResponseInputItem], [
+        {
+            "role": "user",
+            "content": [
+                {"type": "input_text", "text": "Analyze the attached image for safety and product. Return JSON only."},
+                {"type": "input_image", "image_url": image_url}
+            ]
+        }
+    ])
+    vision_result_temp = await _run_agent(vision_safety_product_agent, vision_input, VISION_RUN_CONFIG)
+    return vision_result_temp.final_output.model_dump()
+
+
+async def _vision_cache_key(image_url: str) -> str:
+    """Cache key from the storage object's ETag (a HEAD request, no body download); falls back to hashing the URL."""
+    if image_url.startswith(("http://", "https://")):
+        try:
+            resp = await get_http_client().head(image_url, timeout=5.0, follow_redirects=True)
+            etag = (resp.headers.get("etag") or "").removeprefix("W/").strip('"') if resp.is_success else ""
+            if etag:
+                # Storage ETags are content digests, so the same photo re-uploaded under a new path still hits
+                return f"{VISION_PROMPT_VERSION}:etag:{etag}"
+        except httpx.HTTPError:
+            logger.debug("Could not HEAD %s for vision cache key", image_url, exc_info=True)
+    return f"{VISION_PROMPT_VERSION}:url:{hashlib.sha256(image_url.encode('utf-8')).hexdigest()}"
+
+
+async def _analyze_one(media_path: str, image_url: str) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    """(path, vision_result, error) for one image; errors are returned so a gather never aborts mid-batch."""
+    try:
+        return media_path, await _run_vision_single(image_url), None
+    except Exception as exc:  # pragma: no cover
+        return media_path, None, f"vision_error: {exc}"
+
+
+async def _run_vision_batch(image_urls: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """Analyze several images in one multi-image call; slots the model skipped stay None."""
+    content: List[Dict[str, Any]] = [{
+        "type": "input_text",
+        "text": f"Analyze each of the {len(image_urls)} attached images (index 0-{len(image_urls) - 1}) for safety and product. Return JSON only.",
+    }]
+    content.extend({"type": "input_image", "image_url": url} for url in image_urls)
+    vision_result_temp = await _run_agent(
+        vision_safety_batch_agent,
+        cast(List[TResponseInputItem], [{"role": "user", "content": content}]),
+        VISION_BATCH_RUN_CONFIG
+    )
+    out: List[Optional[Dict[str, Any]]] = [None] * len(image_urls)
+    for item in vision_result_temp.final_output.results:
+        if 0 <= item.index < len(out) and out[item.index] is None:
+            out[item.index] = item.model_dump(exclude={"index"})
+    return out
+
+
+# Agent replies that end a listing flow ("✅ İlan yayınlandı" is covered by "ilan yayınlandı")
+CLEAR_PENDING_MEDIA_RE = re.compile(r"ilan yayınlandı|iptal edildi|işlemi iptal", re.IGNORECASE)
+
+# Strong refs for fire-and-forget tasks; the event loop only keeps weak ones
+_background_tasks: Set["asyncio.Task[Any]"] = set()
+
+
+def _spawn_background(coro: Coroutine[Any, Any, Any]) -> None:
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _maybe_clear_pending_media(user_key: str, final_response: str) -> None:
+    """Drop the user's pending safe media once the agent reports a publish or cancel."""
+    if CLEAR_PENDING_MEDIA_RE.search(final_response):
+        await USER_SAFE_MEDIA_STORE.delete(user_key)
+        logger.info("🧹 Cleared pending safe media for user %s after publish/cancel", user_key)
+
+
 # Main workflow runner
 async def run_workflow(workflow_input: WorkflowInput):
     """
     Main agent workflow - routes user input to appropriate agents
     Uses OpenAI Agents SDK with MCP tools
     """
-    import logging
-    logger = logging.getLogger(__name__)
     
     with trace("PazarGlobal"):
         ctx = WorkflowContext(
@@ -2303,253 +3015,64 @@ async def run_workflow(workflow_input: WorkflowInput):
             conversation_state=workflow_input.conversation_state or {},
         )
         WORKFLOW_CONTEXT.set(ctx)
-        workflow = workflow_input.model_dump()
-
-        def _parse_last_search_results_from_history(raw_hist: Any) -> List[Dict[str, Any]]:
-            """Parse a compact [LAST_SEARCH_RESULTS] note from incoming history.
-
-            Expected format:
-              [LAST_SEARCH_RESULTS] #1 id=... title=... | #2 id=... title=...
-            """
-            out: List[Dict[str, Any]] = []
-            if not isinstance(raw_hist, list):
-                return out
-            # Scan from newest to oldest
-            for msg in reversed(raw_hist):
-                if not isinstance(msg, dict):
-                    continue
-                if msg.get("role") != "assistant":
-                    continue
-                text = msg.get("content")
-                if not isinstance(text, str):
-                    continue
-                if "[LAST_SEARCH_RESULTS]" not in text:
-                    continue
-                # Extract segments like #1 id=... title=...
-                segments = text.split("[LAST_SEARCH_RESULTS]", 1)[1]
-                for m in re.finditer(r"#\d+\s+id=([0-9a-fA-F-]{36})\s+title=([^|]+)", segments):
-                    lid = m.group(1).strip()
-                    title = m.group(2).strip()
-                    if lid:
-                        out.append({"id": lid, "title": title})
-                if out:
-                    return out
-            return out
+        # Identity/auth never change within a turn, so resolve them once instead of at every use
+        resolved = resolve_all()
+        # Only the text field is copied: PII masking rewrites it in place, everything else is read off the model
+        # (a full model_dump() would deep-copy conversation_history on every turn)
+        workflow = workflow_input.model_dump(include={"input_as_text"})
         
         # DEBUG: Log media paths to diagnose webchat image upload issue
-        if workflow.get("media_paths"):
-            logger.info(f"🖼️  WORKFLOW media_paths received: {workflow.get('media_paths')}")
-            logger.info(f"🖼️  WORKFLOW media_type: {workflow.get('media_type')}")
+        if workflow_input.media_paths:
+            logger.info("🖼️  WORKFLOW media_paths received: %s", workflow_input.media_paths)
+            logger.info("🖼️  WORKFLOW media_type: %s", workflow_input.media_type)
         
-        # Build conversation history from previous messages
-        conversation_history: List[TResponseInputItem] = []
-
-        # Expose user context and auth/state to agents for fallback (owner phone/name/auth/session)
-        if workflow_input.user_id or workflow_input.user_phone or workflow_input.user_name:
-            context_note_parts: List[str] = []
-            if workflow_input.user_id:
-                context_note_parts.append(f"USER_ID={workflow_input.user_id}")
-            if workflow_input.user_phone:
-                context_note_parts.append(f"USER_PHONE={workflow_input.user_phone}")
-            if workflow_input.user_name:
-                context_note_parts.append(f"USER_NAME={workflow_input.user_name}")
-            context_note = "[USER_CONTEXT] " + " | ".join(context_note_parts)
-            conversation_history.append(cast(TResponseInputItem, {
-                "role": "assistant",
-                "content": [
-                    {"type": "output_text", "text": context_note}
-                ]
-            }))
-
-        if workflow_input.auth_context:
-            auth_parts: List[str] = []
-            ac = workflow_input.auth_context or {}
-            if isinstance(ac, dict):
-                if ac.get("user_id"):
-                    auth_parts.append(f"AUTH_USER_ID={ac.get('user_id')}")
-                if ac.get("phone"):
-                    auth_parts.append(f"AUTH_PHONE={ac.get('phone')}")
-                auth_parts.append(f"AUTHENTICATED={bool(ac.get('authenticated'))}")
-                if ac.get("session_expires_at"):
-                    auth_parts.append(f"SESSION_EXPIRES_AT={ac.get('session_expires_at')}")
-            auth_note = "[AUTH_CONTEXT] " + " | ".join(auth_parts)
-            conversation_history.append(cast(TResponseInputItem, {
-                "role": "assistant",
-                "content": [
-                    {"type": "output_text", "text": auth_note}
-                ]
-            }))
-
-        if workflow_input.conversation_state:
-            cs = workflow_input.conversation_state or {}
-            state_parts: List[str] = []
-            if isinstance(cs, dict):
-                if cs.get("mode"):
-                    state_parts.append(f"MODE={cs.get('mode')}")
-                if cs.get("active_listing_id"):
-                    state_parts.append(f"ACTIVE_LISTING_ID={cs.get('active_listing_id')}")
-                if cs.get("last_intent"):
-                    state_parts.append(f"LAST_INTENT={cs.get('last_intent')}")
-            state_note = "[CONVERSATION_STATE] " + " | ".join(state_parts)
-            conversation_history.append(cast(TResponseInputItem, {
-                "role": "assistant",
-                "content": [
-                    {"type": "output_text", "text": state_note}
-                ]
-            }))
-        
-        # TOKEN OPTIMIZATION: Keep only last 10 messages to avoid exponential history growth
-        # (vision + long threads can reach 100K tokens otherwise)
-        raw_history = workflow.get("conversation_history", [])
-        pruned_history = raw_history[-10:] if len(raw_history) > 10 else raw_history
+        # State as received; the [CONVERSATION_STATE] note reports this, not the active-listing fills below
+        incoming_state = dict(ctx.conversation_state) if isinstance(ctx.conversation_state, dict) else ctx.conversation_state
+
+        # Only the last HISTORY_WINDOW messages go into agent input; the full history stays on the model
+        # for the "1 nolu ilan" fallback, which may need a search-results note older than the window
+        pruned_history = workflow_input.conversation_history[-HISTORY_WINDOW:]
         
         # Server-side pending safe media: if this user has safe images from previous message,
         # inject them as SYSTEM_MEDIA_NOTE so agents can use them (WhatsApp/WebChat both benefit)
-        user_id_key = resolve_user_id(workflow_input.user_id) or workflow_input.user_id or "anonymous"
-        pending_safe_media = USER_SAFE_MEDIA_STORE.get(user_id_key, [])
-        has_explicit_media = bool(workflow.get("media_paths"))
+        user_id_key = workflow_input.user_id or resolved.user_id or "anonymous"
+        pending_safe_media = await USER_SAFE_MEDIA_STORE.get(user_id_key, [])
+        has_explicit_media = bool(workflow_input.media_paths)
 
         # If we have a stored active listing for this user and none is provided, reuse it
         if isinstance(ctx.conversation_state, dict) and not ctx.conversation_state.get("active_listing_id"):
-            stored_active = USER_ACTIVE_LISTING_STORE.get(user_id_key)
+            stored_active = await USER_ACTIVE_LISTING_STORE.get(user_id_key)
             if stored_active:
                 ctx.conversation_state["active_listing_id"] = stored_active
 
         # If user references "X nolu ilan", resolve it against last search results and persist active listing
         raw_user_text_full = (workflow.get("input_as_text") or "")
         requested_num = _extract_listing_number(raw_user_text_full)
+        requested_listing_id: Optional[str] = None
         if requested_num is not None:
-            last = USER_LAST_SEARCH_RESULTS_STORE.get(user_id_key) or []
-            if not last:
-                last = _parse_last_search_results_from_history(workflow.get("conversation_history"))
+            last = await _get_last_results_for_user(user_id_key, workflow_input.conversation_history)
             idx = requested_num - 1
             if 0 <= idx < len(last):
                 mapped_id = last[idx].get("id")
                 if mapped_id and _is_uuid(str(mapped_id)):
-                    USER_ACTIVE_LISTING_STORE[user_id_key] = str(mapped_id)
-                    if isinstance(ctx.conversation_state, dict):
-                        ctx.conversation_state["active_listing_id"] = str(mapped_id)
-                    conversation_history.append(cast(TResponseInputItem, {
-                        "role": "assistant",
-                        "content": [
-                            {"type": "output_text", "text": f"[CONVERSATION_STATE] ACTIVE_LISTING_ID={mapped_id}"}
-                        ]
-                    }))
-
-        # Inject last search results summary when it can help follow-up actions
-        raw_user_text_l = raw_user_text_full.strip().lower()
-        needs_last_search_context = any(k in raw_user_text_l for k in (
-            "nolu", "numar", "detay", "göster", "goster", "foto", "kategori", "güncelle", "guncelle", "sil"
-        ))
-        if needs_last_search_context:
-            last = USER_LAST_SEARCH_RESULTS_STORE.get(user_id_key) or []
-            if last:
-                lines: List[str] = []
-                for i, item in enumerate(last[:10], start=1):
-                    title = item.get("title") or ""
-                    listing_id = item.get("id") or ""
-                    if not listing_id:
-                        continue
-                    lines.append(f"#{i} id={listing_id} title={title}")
-                if lines:
-                    conversation_history.append(cast(TResponseInputItem, {
-                        "role": "assistant",
-                        "content": [
-                            {"type": "output_text", "text": "[LAST_SEARCH_RESULTS] " + " | ".join(lines)}
-                        ]
-                    }))
-        
-        # Add previous conversation context if exists (NOT including current message)
-        for msg in pruned_history:
-            role = msg.get("role", "user")
-            content = msg.get("content", "")
-            
-            # Skip empty messages
-            if not content:
-                continue
-            
-            # CRITICAL: OpenAI Agents SDK uses different content types for user vs assistant
-            if role == "user":
-                conversation_history.append(cast(TResponseInputItem, {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_text",  # User messages use input_text
-                            "text": content
-                        }
-                    ]
-                }))
-            elif role == "assistant":
-                conversation_history.append(cast(TResponseInputItem, {
-                    "role": "assistant",
-                    "content": [
-                        {
-                            "type": "output_text",  # Assistant messages use output_text!
-                            "text": content
-                        }
-                    ]
-                }))
-        
-        # Add current user message (this is the new message to process)
-        current_message_text = workflow["input_as_text"]
-        
-        # Prepend user name if available for personalized greeting
-        if workflow.get("user_name"):
-            current_message_text = f"[USER_NAME: {workflow['user_name']}] {current_message_text}"
-        
-        conversation_history.append(cast(TResponseInputItem, {
-            "role": "user",
-            "content": [
-                {
-                    "type": "input_text",
-                    "text": current_message_text
-                }
-            ]
-        }))
-
-        # Attach draft context note (media paths are attached AFTER safety check as SAFE_MEDIA_PATHS)
-        if workflow.get("draft_listing_id"):
-            media_note_text = f"[SYSTEM_MEDIA_NOTE] DRAFT_LISTING_ID={workflow['draft_listing_id']}"
-            logger.info(f"📝 Adding SYSTEM_MEDIA_NOTE to conversation: {media_note_text}")
-            conversation_history.append(cast(TResponseInputItem, {
-                "role": "assistant",
-                "content": [
-                    {
-                        "type": "output_text",
-                        "text": media_note_text
-                    }
-                ]
-            }))
-        
-        # Run guardrails
-        guardrails_input_text = workflow["input_as_text"]
-        guardrails_result = await run_and_apply_guardrails(
-            guardrails_input_text,
-            guardrails_sanitize_input_config,
-            conversation_history,
-            workflow
-        )
-        guardrails_hastripwire = guardrails_result["has_tripwire"]
-        
-        if guardrails_hastripwire:
-            return {"error": "Content blocked by guardrails"}
+                    await _set_active_listing(user_id_key, str(mapped_id), ctx.conversation_state)
+                    requested_listing_id = str(mapped_id)
 
         # Server-side deterministic detail view for "X nolu ilanı göster".
         # This avoids LLM confusion and fixes WebChat/WhatsApp when history is pruned.
+        # Handled before history/guardrail setup: it is a read-only render of our own search results, no LLM involved.
         raw_user_text_detail = (workflow.get("input_as_text") or "")
-        raw_user_text_detail_l = raw_user_text_detail.strip().lower()
+        raw_user_text_detail_l = _fold_tr(raw_user_text_detail)
         detail_num = _extract_listing_number(raw_user_text_detail)
         wants_detail = (
             detail_num is not None
-            and any(k in raw_user_text_detail_l for k in ("detay", "detaylı", "detayli", "göster", "goster", "foto", "fotoğraf", "fotograf"))
+            and DETAIL_VIEW_RE.search(raw_user_text_detail_l) is not None
             and "ilan" in raw_user_text_detail_l
         )
-        is_update_like = any(k in raw_user_text_detail_l for k in ("güncelle", "guncelle", "düzenle", "duzenle", "değiş", "degis", "sil"))
-        if wants_detail and not is_update_like:
+        is_update_like = UPDATE_LIKE_RE.search(raw_user_text_detail_l) is not None
+        if wants_detail and not is_update_like and not workflow_input.media_paths:
             try:
-                last = USER_LAST_SEARCH_RESULTS_STORE.get(user_id_key) or []
-                if not last:
-                    last = _parse_last_search_results_from_history(workflow.get("conversation_history"))
+                last = await _get_last_results_for_user(user_id_key, workflow_input.conversation_history)
                 idx = (detail_num or 0) - 1
                 if idx < 0 or idx >= len(last):
                     return {
@@ -2596,7 +3119,7 @@ async def run_workflow(workflow_input: WorkflowInput):
                 property_type = str(item.get("property_type") or "").strip()
 
                 user_name = str(item.get("user_name") or item.get("owner_name") or "").strip()
-                user_phone = str(item.get("user_phone") or item.get("owner_phone") or resolve_user_phone() or "").strip()
+                user_phone = str(item.get("user_phone") or item.get("owner_phone") or resolved.user_phone or "").strip()
                 phone_line = f"İlan sahibi: {user_name} | Telefon: {user_phone}" if user_name and user_phone else (
                     f"İlan sahibi: {user_name}" if user_name else (f"Telefon: {user_phone}" if user_phone else "Telefon yok")
                 )
@@ -2647,79 +3170,189 @@ async def run_workflow(workflow_input: WorkflowInput):
                     "success": False,
                 }
 
+        # Plain balance questions are answered from the wallet table alone (no LLM sees the text),
+        # so they return before guardrails are even started
+        if (
+            not workflow_input.media_paths
+            and resolved.user_id
+            and _is_plain_balance_query(raw_user_text_full)
+        ):
+            balance_reply = await _plain_balance_reply(resolved.user_id)
+            if balance_reply:
+                return {
+                    "response": balance_reply,
+                    "intent": "wallet_query",
+                    "success": True,
+                    "safe_media_paths": [],
+                    "blocked_media_paths": [],
+                }
+
+        # Inject last search results summary when it can help follow-up actions
+        last_search_lines: List[str] = []
+        if LAST_SEARCH_CONTEXT_RE.search(_fold_tr(raw_user_text_full)) is not None:
+            for i, item in enumerate((await USER_LAST_SEARCH_RESULTS_STORE.get(user_id_key) or [])[:10], start=1):
+                listing_id = item.get("id") or ""
+                if listing_id:
+                    last_search_lines.append(f"#{i} id={listing_id} title={item.get('title') or ''}")
+
+        # Add current user message (this is the new message to process)
+        current_message_text = workflow["input_as_text"]
+
+        # Prepend user name if available for personalized greeting
+        if workflow_input.user_name:
+            current_message_text = f"[USER_NAME: {workflow_input.user_name}] {current_message_text}"
+
+        def _build_history() -> Iterator[TResponseInputItem]:
+            """Agent input in prompt order: user context, auth, state, active listing, last search, prior turns, current message, draft note"""
+            # Expose user context and auth/state to agents for fallback (owner phone/name/auth/session)
+            if workflow_input.user_id or workflow_input.user_phone or workflow_input.user_name:
+                context_note_parts: List[str] = []
+                if workflow_input.user_id:
+                    context_note_parts.append(f"USER_ID={workflow_input.user_id}")
+                if workflow_input.user_phone:
+                    context_note_parts.append(f"USER_PHONE={workflow_input.user_phone}")
+                if workflow_input.user_name:
+                    context_note_parts.append(f"USER_NAME={workflow_input.user_name}")
+                yield _assistant_note("[USER_CONTEXT] " + " | ".join(context_note_parts))
+
+            if workflow_input.auth_context:
+                auth_parts: List[str] = []
+                ac = workflow_input.auth_context or {}
+                if isinstance(ac, dict):
+                    if ac.get("user_id"):
+                        auth_parts.append(f"AUTH_USER_ID={ac.get('user_id')}")
+                    if ac.get("phone"):
+                        auth_parts.append(f"AUTH_PHONE={ac.get('phone')}")
+                    auth_parts.append(f"AUTHENTICATED={bool(ac.get('authenticated'))}")
+                    if ac.get("session_expires_at"):
+                        auth_parts.append(f"SESSION_EXPIRES_AT={ac.get('session_expires_at')}")
+                yield _assistant_note("[AUTH_CONTEXT] " + " | ".join(auth_parts))
+
+            if incoming_state:
+                yield _assistant_note("[CONVERSATION_STATE] " + " | ".join(_state_note_parts(incoming_state)))
+
+            if requested_listing_id:
+                yield _assistant_note(f"[CONVERSATION_STATE] ACTIVE_LISTING_ID={requested_listing_id}")
+
+            if last_search_lines:
+                yield _assistant_note("[LAST_SEARCH_RESULTS] " + " | ".join(last_search_lines))
+
+            # Add previous conversation context if exists (NOT including current message)
+            # CRITICAL: OpenAI Agents SDK uses different content types for user vs assistant
+            for msg in pruned_history:
+                content = msg.get("content")
+                build_item = HISTORY_ITEM_BUILDERS.get(msg.get("role", "user"))
+                # Skip empty messages and roles the agents don't take as input
+                if content and build_item is not None:
+                    yield build_item(content)
+
+            yield _user_message(current_message_text)
+
+            # Attach draft context note (media paths are attached AFTER safety check as SAFE_MEDIA_PATHS)
+            if workflow_input.draft_listing_id:
+                media_note_text = _media_note_text(workflow_input.draft_listing_id)
+                logger.info("📝 Adding SYSTEM_MEDIA_NOTE to conversation: %s", media_note_text)
+                yield _assistant_note(media_note_text)
+
+        # Built in one pass; later steps (router output, vision notes, parsed draft) still append to it
+        conversation_history: List[TResponseInputItem] = list(_build_history())
+
+        # Run guardrails. The verdict is awaited lazily so it overlaps the router LLM call;
+        # every step with side effects (detail fetch, vision, dispatch) awaits it first.
+        guardrails_input_text = workflow["input_as_text"]
+        guardrails_task = asyncio.ensure_future(run_and_apply_guardrails(
+            guardrails_input_text,
+            guardrails_sanitize_input_config,
+            conversation_history,
+            workflow
+        ))
+
+        async def _guardrails_blocked() -> bool:
+            guardrails_result = await guardrails_task
+            return bool(guardrails_result["has_tripwire"])
+
+        # PII masking rewrites history/workflow in place, so nothing may read them before it finishes
+        if _index_guardrails(guardrails_sanitize_input_config).get("Contains PII") is not None:
+            if await _guardrails_blocked():
+                return {"error": "Content blocked by guardrails"}
+
         # Fast-path routing for wallet queries (avoid misclassification to small_talk)
-        raw_user_text = (workflow.get("input_as_text") or "").strip().lower()
-        wallet_keywords = (
-            "bakiye",
-            "bakiyem",
-            "kredi",
-            "kredim",
-            "param",
-            "paramı",
-            "cüzdan",
-            "balance",
-            "işlemlerim",
-            "harcamalarım",
-            "geçmiş",
-            "işlem geçmiş",
-        )
-        force_wallet_intent = any(k in raw_user_text for k in wallet_keywords)
+        force_wallet_intent = WALLET_INTENT_RE.search(_fold_tr(workflow.get("input_as_text") or "")) is not None
 
         # Step 0: Vision safety + product extraction (if media provided)
-        media_paths_raw = workflow.get("media_paths")
+        media_paths_raw = workflow_input.media_paths
         media_paths_in: List[str] = media_paths_raw if isinstance(media_paths_raw, list) else ([] if media_paths_raw is None else [str(media_paths_raw)])
 
         # De-duplicate paths while preserving order
-        seen_paths: set[str] = set()
-        media_paths: List[str] = []
-        for p in media_paths_in:
-            sp = str(p).strip()
-            if not sp:
-                continue
-            if sp in seen_paths:
-                continue
-            seen_paths.add(sp)
-            media_paths.append(sp)
+        unique_media_paths = list(dict.fromkeys(sp for sp in (str(p).strip() for p in media_paths_in) if sp))
         
         # HARD LIMIT: Maximum 10 photos per listing (abuse prevention)
-        if len(media_paths) > 10:
-            logger.warning(f"⚠️ User {user_id_key} tried to upload {len(media_paths)} photos, limiting to 10")
-            media_paths = media_paths[:10]
+        if len(unique_media_paths) > 10:
+            logger.warning("⚠️ User %s tried to upload %d photos, limiting to 10", user_id_key, len(unique_media_paths))
+        media_paths: List[str] = unique_media_paths[:10]
 
         safe_media_paths: List[str] = []
         blocked_media_paths: List[Dict[str, Any]] = []
         first_safe_vision: Optional[Dict[str, Any]] = None
+        safety_log_task: Optional["asyncio.Future[Dict[str, Any]]"] = None
+
+        def _reply(response: Optional[str], intent: str, success: bool = True) -> Dict[str, Any]:
+            """Reply payload for every exit from here on; always carries this turn's safe/blocked media"""
+            return {
+                "response": response,
+                "intent": intent,
+                "success": success,
+                "safe_media_paths": safe_media_paths,
+                "blocked_media_paths": blocked_media_paths,
+            }
 
         # VisionSafetyProductAgent only runs when explicit media is present
+        if media_paths and await _guardrails_blocked():
+            return {"error": "Content blocked by guardrails"}
         if media_paths:
+            image_urls = {media_path: _resolve_public_image_url(media_path) for media_path in media_paths}
+            cache_keys = dict(zip(media_paths, await asyncio.gather(*(_vision_cache_key(image_urls[p]) for p in media_paths))))
+            vision_by_path: Dict[str, Dict[str, Any]] = {}
+            vision_errors: Dict[str, str] = {}
+            pending_paths: List[str] = []
             for media_path in media_paths:
-                image_url = _resolve_public_image_url(str(media_path))
-                vision_input: List[TResponseInputItem] = cast(List[TResponseInputItem], [
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "input_text", "text": "Analyze the attached image for safety and product. Return JSON only."},
-                            {"type": "input_image", "image_url": image_url}
-                        ]
-                    }
-                ])
+                cached_vision = VISION_RESULT_CACHE.get(cache_keys[media_path])
+                if cached_vision is not None:
+                    vision_by_path[media_path] = dict(cached_vision)
+                else:
+                    pending_paths.append(media_path)
 
+            # One multi-image call instead of a round-trip per photo; anything it misses goes through the per-image path
+            if len(pending_paths) > 1:
                 try:
-                    vision_result_temp = await Runner.run(
-                        vision_safety_product_agent,
-                        input=vision_input,  # type: ignore[arg-type]
-                        run_config=RunConfig(trace_metadata={
-                            "__trace_source__": "agent-builder",
-                            "workflow_id": "vision_safety_product"
-                        })
-                    )
-                    vision_result = vision_result_temp.final_output.model_dump()
-                except Exception as exc:  # pragma: no cover
+                    batch_results = await _run_vision_batch([image_urls[p] for p in pending_paths])
+                except Exception:
+                    logger.warning("Batched vision analysis failed, falling back to per-image calls", exc_info=True)
+                    batch_results = [None] * len(pending_paths)
+                for media_path, batch_result in zip(pending_paths, batch_results):
+                    if batch_result is not None:
+                        vision_by_path[media_path] = batch_result
+                        VISION_RESULT_CACHE[cache_keys[media_path]] = dict(batch_result)
+                pending_paths = [p for p in pending_paths if p not in vision_by_path]
+
+            # Remaining single-image calls are independent, so wait for the slowest one rather than their sum
+            single_results = await asyncio.gather(*(_analyze_one(p, image_urls[p]) for p in pending_paths))
+            for media_path, vision_result, vision_error in single_results:
+                if vision_result is None:
+                    vision_errors[media_path] = vision_error or "vision_error"
+                    continue
+                vision_by_path[media_path] = vision_result
+                VISION_RESULT_CACHE[cache_keys[media_path]] = dict(vision_result)
+
+            safety_flags: List[Dict[str, Any]] = []
+            for media_path in media_paths:
+                if media_path in vision_errors:
                     blocked_media_paths.append({
                         "path": str(media_path),
-                        "reason": f"vision_error: {exc}",
+                        "reason": vision_errors[media_path],
                     })
                     continue
+                vision_result = vision_by_path[media_path]
 
                 safe_flag = bool(vision_result.get("safe"))
                 flag_type = (vision_result.get("flag_type") or "unknown")
@@ -2731,14 +3364,14 @@ async def run_workflow(workflow_input: WorkflowInput):
                     allow_listing_flag = True
 
                 if (not safe_flag) or (not allow_listing_flag):
-                    # Log flag for admin review (no auto-ban)
-                    log_image_safety_flag(
-                        user_id=workflow.get("user_id"),
+                    # Log flag for admin review (no auto-ban); all flags of this upload are inserted together below
+                    safety_flags.append(build_image_safety_flag(
+                        user_id=workflow_input.user_id,
                         image_url=str(media_path),
                         flag_type=flag_type,
                         confidence=vision_result.get("confidence", "low"),
                         message=vision_result.get("message", "unsafe"),
-                    )
+                    ))
                     blocked_media_paths.append({
                         "path": str(media_path),
                         "reason": vision_result.get("message", "unsafe"),
@@ -2752,123 +3385,102 @@ async def run_workflow(workflow_input: WorkflowInput):
                 if first_safe_vision is None:
                     first_safe_vision = vision_result
 
+            if safety_flags:
+                # supabase-py is synchronous; one multi-row insert off the event loop instead of one blocking call per image.
+                # Nothing downstream reads the flags, so the insert overlaps the router call and is awaited after it.
+                safety_log_task = asyncio.ensure_future(asyncio.to_thread(log_image_safety_flags, safety_flags))
+
             # If all images are blocked, stop
             if not safe_media_paths:
+                if safety_log_task is not None:
+                    await safety_log_task
                 first_reason = blocked_media_paths[0].get("reason") if blocked_media_paths else "unsafe image"
-                return {
-                    "response": f"❌ Güvenlik nedeniyle reddedildi: {first_reason}. Bu görseller işleme alınmadı, lütfen farklı görsel gönderin.",
-                    "intent": "vision_safety_blocked",
-                    "success": False,
-                    "safe_media_paths": [],
-                    "blocked_media_paths": blocked_media_paths,
-                }
+                return _reply(
+                    f"❌ Güvenlik nedeniyle reddedildi: {first_reason}. Bu görseller işleme alınmadı, lütfen farklı görsel gönderin.",
+                    "vision_safety_blocked",
+                    success=False,
+                )
 
             # Attach SAFE media paths for downstream agents (listing/publish)
-            safe_media_note_parts: List[str] = []
-            if workflow.get("draft_listing_id"):
-                safe_media_note_parts.append(f"DRAFT_LISTING_ID={workflow['draft_listing_id']}")
-            safe_media_note_parts.append(f"MEDIA_PATHS={safe_media_paths}")
-            safe_media_note_text = f"[SYSTEM_MEDIA_NOTE] {' | '.join(safe_media_note_parts)}"
-            logger.info(f"📝 Adding SYSTEM_MEDIA_NOTE (SAFE MEDIA_PATHS) to conversation: {safe_media_note_text}")
-            conversation_history.append(cast(TResponseInputItem, {
-                "role": "assistant",
-                "content": [
-                    {
-                        "type": "output_text",
-                        "text": safe_media_note_text
-                    }
-                ]
-            }))
-            
-            # Store safe media in session for WhatsApp multi-message flow
-            USER_SAFE_MEDIA_STORE[user_id_key] = safe_media_paths[:]
-            logger.info(f"💾 Stored {len(safe_media_paths)} safe media paths for user {user_id_key}")
+            safe_media_note_text = _media_note_text(workflow_input.draft_listing_id, safe_media_paths)
+            logger.info("📝 Adding SYSTEM_MEDIA_NOTE (SAFE MEDIA_PATHS) to conversation: %s", safe_media_note_text)
+            # Media and vision notes go out as one assistant item (one line each) rather than separate messages
+            media_note_lines: List[str] = [safe_media_note_text]
+
+            # Store safe media in session for WhatsApp multi-message flow.
+            # safe_media_paths is complete here and only read afterwards (return payload), so no copy is needed;
+            # it must stay a list because the pending note renders it as MEDIA_PATHS=[...]
+            await USER_SAFE_MEDIA_STORE.set(user_id_key, safe_media_paths)
+            logger.info("💾 Stored %d safe media paths for user %s", len(safe_media_paths), user_id_key)
 
             # Append compact product summary for downstream agents (use first safe image only)
             if first_safe_vision:
                 product_info: Dict[str, Any] = first_safe_vision.get("product") or {}
-                product_attrs = ", ".join(cast(List[str], product_info.get("attributes", []) or []))
-                conversation_history.append(cast(TResponseInputItem, {
-                    "role": "assistant",
-                    "content": [
-                        {
-                            "type": "output_text",
-                            "text": (
-                                f"[VISION_PRODUCT] safe=true; allow_listing={first_safe_vision.get('allow_listing', True)}; "
-                                f"title={product_info.get('title') or 'unknown'}; "
-                                f"category={product_info.get('category') or 'unknown'}; "
-                                f"condition={product_info.get('condition') or 'unknown'}; "
-                                f"quantity={product_info.get('quantity') or 1}; "
-                                f"attributes={product_attrs or 'none'}"
-                            )
-                        }
-                    ]
-                }))
+                # Only fields the vision model actually filled; "unknown" placeholders were just extra tokens
+                vision_fields = ["safe=true", f"allow_listing={first_safe_vision.get('allow_listing', True)}"]
+                for key in ("title", "category", "condition"):
+                    value = product_info.get(key)
+                    if value:
+                        vision_fields.append(f"{key}={value}")
+                quantity = product_info.get("quantity")
+                if quantity and quantity != 1:
+                    vision_fields.append(f"quantity={quantity}")
+                attrs = product_info.get("attributes")
+                if attrs:
+                    vision_fields.append(f"attributes={', '.join(attrs)}")
+                media_note_lines.append("[VISION_PRODUCT] " + "; ".join(vision_fields))
+            conversation_history.append(_assistant_note("\n".join(media_note_lines)))
         elif pending_safe_media and not has_explicit_media:
             # No new media this message, but user has pending safe media from previous upload
             # → inject it so agent can use (WhatsApp: "send photo" then "publish listing" flow)
-            pending_note = f"[SYSTEM_MEDIA_NOTE] MEDIA_PATHS={pending_safe_media}"
-            logger.info(f"♻️ Injecting pending safe media for user {user_id_key}: {pending_note}")
-            conversation_history.append(cast(TResponseInputItem, {
-                "role": "assistant",
-                "content": [
-                    {
-                        "type": "output_text",
-                        "text": pending_note
-                    }
-                ]
-            }))
+            pending_note = _media_note_text(None, pending_safe_media)
+            logger.info("♻️ Injecting pending safe media for user %s: %s", user_id_key, pending_note)
+            conversation_history.append(_assistant_note(pending_note))
         
         # Step 1: Classify intent (ensure USER_CONTEXT note is part of history for personalization and ownership)
+        fast_intent = None
+        if not force_wallet_intent and not media_paths_in and not pending_safe_media:
+            fast_intent = _fast_route_intent(workflow.get("input_as_text") or "", pruned_history)
         if force_wallet_intent:
             intent = "wallet_query"
+        elif fast_intent:
+            intent = fast_intent
+            logger.info("⚡ Fast-routed intent without classifier: %s", intent)
         else:
-            router_agent_intent_classifier_result_temp = await Runner.run(
+            # Router is read-only, so it can run alongside the guardrails and be cancelled on a tripwire
+            router_task = asyncio.ensure_future(_run_agent(
                 router_agent_intent_classifier,
-                input=[*conversation_history],
-                run_config=RunConfig(trace_metadata={
-                    "__trace_source__": "agent-builder",
-                    "workflow_id": "wf_691884cc7e6081908974fe06852942af0249d08cf5054fdb"
-                })
-            )
-            
-            conversation_history.extend([item.to_input_item() for item in router_agent_intent_classifier_result_temp.new_items])
-            
-            router_agent_intent_classifier_result = {
-                "output_text": router_agent_intent_classifier_result_temp.final_output.json(),
-                "output_parsed": router_agent_intent_classifier_result_temp.final_output.model_dump()
-            }
-            
-            intent = router_agent_intent_classifier_result["output_parsed"]["intent"]
+                _select_classifier_context(conversation_history),
+                WORKFLOW_RUN_CONFIG
+            ))
+            try:
+                blocked = await _guardrails_blocked()
+            except BaseException:
+                router_task.cancel()
+                raise
+            if blocked:
+                router_task.cancel()
+                return {"error": "Content blocked by guardrails"}
+            router_agent_intent_classifier_result_temp = await router_task
+
+            # Read the parsed field directly; re-serializing the model only to index the dict is wasted work
+            intent = router_agent_intent_classifier_result_temp.final_output.intent
+
+        if await _guardrails_blocked():
+            return {"error": "Content blocked by guardrails"}
+        if safety_log_task is not None:
+            await safety_log_task
 
-        # Persist last intent in conversation_state and expose to downstream agents
-        state_for_update = resolve_conversation_state()
+        # Persist last intent in conversation_state; the agent-facing note is only built if an agent runs
+        state_for_update = ctx.conversation_state
         if isinstance(state_for_update, dict):
             state_for_update["last_intent"] = intent
-            state_parts: List[str] = []
-            if state_for_update.get("mode"):
-                state_parts.append(f"MODE={state_for_update.get('mode')}")
-            if state_for_update.get("active_listing_id"):
-                state_parts.append(f"ACTIVE_LISTING_ID={state_for_update.get('active_listing_id')}")
-            if state_for_update.get("last_intent"):
-                state_parts.append(f"LAST_INTENT={state_for_update.get('last_intent')}")
-            if state_parts:
-                conversation_history.append(cast(TResponseInputItem, {
-                    "role": "assistant",
-                    "content": [
-                        {
-                            "type": "output_text",
-                            "text": "[CONVERSATION_STATE] " + " | ".join(state_parts)
-                        }
-                    ]
-                }))
 
         # Authentication gate for protected intents
-        auth_ctx = resolve_auth_context()
-        resolved_user_id = resolve_user_id()
+        auth_ctx = resolved.auth_context
+        resolved_user_id = resolved.user_id
         is_authenticated = bool(auth_ctx.get("authenticated") and resolved_user_id)
-        protected_intents = {"update_listing", "delete_listing"}
-        if intent in protected_intents and not is_authenticated:
+        if intent in PROTECTED_INTENTS and not is_authenticated:
             return {
                 "response": "Bu işlem için giriş yapmanız gerekiyor. Lütfen PIN ile giriş yapın.",
                 "intent": "auth_required",
@@ -2876,102 +3488,48 @@ async def run_workflow(workflow_input: WorkflowInput):
             }
         
         # Step 2: Route to appropriate agent
-        # TEMPORARILY DISABLED pin_request - causing 500 errors
-        if intent == "pin_request":
-            # Fallback to small_talk when PIN is requested but disabled
-            result = await Runner.run(
-                smalltalkagent,
-                input=[*conversation_history],
-                run_config=RunConfig(trace_metadata={
-                    "__trace_source__": "agent-builder",
-                    "workflow_id": "wf_691884cc7e6081908974fe06852942af0249d08cf5054fdb"
-                })
-            )
-        elif intent == "create_listing":
-            result = await Runner.run(
-                listingagent,
-                input=[*conversation_history],
-                run_config=RunConfig(trace_metadata={
-                    "__trace_source__": "agent-builder",
-                    "workflow_id": "wf_691884cc7e6081908974fe06852942af0249d08cf5054fdb"
-                })
-            )
-        elif intent == "update_listing":
-            result = await Runner.run(
-                updatelistingagent,
-                input=[*conversation_history],
-                run_config=RunConfig(trace_metadata={
-                    "__trace_source__": "agent-builder",
-                    "workflow_id": "wf_691884cc7e6081908974fe06852942af0249d08cf5054fdb"
-                })
-            )
-        elif intent == "publish_listing":
-            result = await Runner.run(
-                publishagent,
-                input=[*conversation_history],
-                run_config=RunConfig(trace_metadata={
-                    "__trace_source__": "agent-builder",
-                    "workflow_id": "wf_691884cc7e6081908974fe06852942af0249d08cf5054fdb"
-                })
-            )
-        elif intent == "wallet_query":
-            # Wallet queries must reach an agent that has wallet tools.
-            result = await Runner.run(
-                publishagent,
-                input=[*conversation_history],
-                run_config=RunConfig(trace_metadata={
-                    "__trace_source__": "agent-builder",
-                    "workflow_id": "wf_691884cc7e6081908974fe06852942af0249d08cf5054fdb"
-                })
-            )
-        elif intent == "search_product":
+        if intent == "search_product":
             composer_payload = await _handle_search_intent(user_id_key, raw_user_text_full)
-            composer_payload.setdefault("safe_media_paths", safe_media_paths if 'safe_media_paths' in locals() else [])
-            composer_payload.setdefault("blocked_media_paths", blocked_media_paths if 'blocked_media_paths' in locals() else [])
+            composer_payload.setdefault("safe_media_paths", safe_media_paths)
+            composer_payload.setdefault("blocked_media_paths", blocked_media_paths)
             return composer_payload
-        elif intent == "small_talk":
-            result = await Runner.run(
-                smalltalkagent,
-                input=[*conversation_history],
-                run_config=RunConfig(trace_metadata={
-                    "__trace_source__": "agent-builder",
-                    "workflow_id": "wf_691884cc7e6081908974fe06852942af0249d08cf5054fdb"
-                })
-            )
-        elif intent == "cancel":
-            result = await Runner.run(
-                cancelagent,
-                input=[*conversation_history],
-                run_config=RunConfig(trace_metadata={
-                    "__trace_source__": "agent-builder",
-                    "workflow_id": "wf_691884cc7e6081908974fe06852942af0249d08cf5054fdb"
-                })
-            )
-        elif intent == "delete_listing":
-            result = await Runner.run(
-                deletelistingagent,
-                input=[*conversation_history],
-                run_config=RunConfig(trace_metadata={
-                    "__trace_source__": "agent-builder",
-                    "workflow_id": "wf_691884cc7e6081908974fe06852942af0249d08cf5054fdb"
-                })
-            )
-        else:
+        if intent == "cancel":
+            await USER_SAFE_MEDIA_STORE.delete(user_id_key)
+            return _reply(CANCEL_RESPONSE, intent)
+
+        agent = INTENT_AGENTS.get(intent)
+        if agent is None:
             return {"error": "Unknown intent", "intent": intent}
+
+        if intent in ("publish_listing", "create_listing"):
+            # Publishing and draft edits both start from the latest preview; hand its fields over pre-parsed
+            parsed_draft = _parse_draft_from_history(conversation_history)
+            if parsed_draft:
+                conversation_history.append(_assistant_note("[PARSED_DRAFT] " + json.dumps(parsed_draft, ensure_ascii=False)))
+        elif intent == "wallet_query":
+            # Balance lookups are a single tool call with a fixed reply; skip the LLM round-trip
+            if resolved_user_id and _is_plain_balance_query(raw_user_text_full):
+                balance_reply = await _plain_balance_reply(resolved_user_id)
+                if balance_reply:
+                    return _reply(balance_reply, intent)
+        elif intent == "small_talk":
+            # Canonical greetings/thanks need no LLM; photo turns still go to the agent to describe the image
+            canned_response = None if first_safe_vision else _canned_small_talk_response(raw_user_text_full, workflow_input.user_name)
+            if canned_response:
+                return _reply(canned_response, intent)
+
+        # Expose the updated state to the routed agent (skipped above for composer/canned/auth replies)
+        if isinstance(state_for_update, dict):
+            state_parts = _state_note_parts(state_for_update)
+            if state_parts:
+                conversation_history.append(_assistant_note("[CONVERSATION_STATE] " + " | ".join(state_parts)))
+
+        result = await _run_agent(agent, conversation_history, WORKFLOW_RUN_CONFIG)
         
         final_response = result.final_output_as(str)
         
-        # Clear pending safe media after publish/cancel (heuristic cleanup)
+        # Clear pending safe media after publish/cancel (heuristic cleanup), after the reply is handed back
         if final_response:
-            response_lower = final_response.lower()
-            if any(keyword in response_lower for keyword in ["ilan yayınlandı", "✅ ilan yayınlandı", "iptal edildi", "işlemi iptal"]):
-                USER_SAFE_MEDIA_STORE.pop(user_id_key, None)
-                logger.info(f"🧹 Cleared pending safe media for user {user_id_key} after publish/cancel")
+            _spawn_background(_maybe_clear_pending_media(user_id_key, final_response))
         
-        return {
-            "response": final_response,
-            "intent": intent,
-            "success": True,
-            "safe_media_paths": safe_media_paths if 'safe_media_paths' in locals() else [],
-            "blocked_media_paths": blocked_media_paths if 'blocked_media_paths' in locals() else [],
-        }
+        return _reply(final_response, intent)